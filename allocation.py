@@ -0,0 +1,230 @@
+import numpy as np
+import pandas as pd
+
+LINE_COLUMNS = ["Commande", "Ref", "Article", "Commandé", "Servi", "Manquant"]
+# À incrémenter dès que les règles d'allocation changent
+ALLOCATION_VERSION = 4
+# Ordre de service des commandes quand le stock ne suffit pas pour tout le monde
+PRIORITIES = {"commande": "N° de commande", "arrivee": "Ordre d'arrivée"}
+
+
+# --- Préparation ---
+
+def stock_lookups(df_stock):
+    # Comme set_index(...).to_dict() : en cas de doublon, la dernière ligne l'emporte.
+    # Ne dépend que du stock : calculé une fois par fichier et partagé (pipeline.lookups_stage)
+    stock = df_stock.drop_duplicates("N° article.", keep="last")
+    # Sentinelle en dernière position : get_indexer renvoie -1 pour une réf. absente du stock
+    inventory = np.append(stock["Inventory"].to_numpy(dtype=float), 0.0)
+    descriptions = np.append(stock["Description"].to_numpy(dtype=object), None)
+    inventory.flags.writeable = descriptions.flags.writeable = False
+    return pd.Index(stock["N° article."]), inventory, descriptions
+
+
+def _service_order(df_cde, priority):
+    if priority == "commande":
+        # Commandes triées par numéro, lignes dans l'ordre du PDF
+        return df_cde.sort_values("Commande", kind="stable")
+    if priority == "arrivee":
+        # Ordre des fichiers reçus, puis ordre des lignes dans chaque fichier
+        return df_cde
+    raise ValueError(f"Priorité inconnue : {priority}")
+
+
+def _demand_before(ref_codes, qte):
+    # Cumul de la demande par référence, sur tableaux triés par clé entière
+    order = np.argsort(ref_codes, kind="stable")
+    q_sorted = qte[order].astype(np.int64)
+    cum = np.cumsum(q_sorted)
+    sorted_codes = ref_codes[order]
+    debut = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]
+    base = np.maximum.accumulate(np.where(debut, cum - q_sorted, 0))
+    before = np.empty_like(cum)
+    before[order] = cum - q_sorted - base
+    return before
+
+
+def _greedy(ref_codes, qte, stock, order=None):
+    # Service glouton dans l'ordre donné (par défaut l'ordre de priorité des lignes)
+    if order is None:
+        return np.minimum(qte, np.clip(stock[ref_codes] - _demand_before(ref_codes, qte), 0, None))
+    servi = np.empty(len(qte), dtype=float)
+    servi[order] = _greedy(ref_codes[order], qte[order], stock)
+    return servi
+
+
+# --- Stratégies ---
+# Chaque stratégie reçoit, dans l'ordre de priorité : la clé entière de la réf. et de la commande
+# par ligne, les quantités, et le stock de départ par réf. ; elle renvoie la quantité servie par ligne.
+
+def _fifo(ref_codes, cmd_codes, qte, stock):
+    return _greedy(ref_codes, qte, stock)
+
+
+def _max_taux_commande(ref_codes, cmd_codes, qte, stock):
+    # Une unité vaut 1 / demande totale de sa commande : servir d'abord les petites commandes
+    # maximise le taux moyen par commande (le taux global, lui, est le même pour toutes les stratégies)
+    demande = np.bincount(cmd_codes, weights=qte)
+    return _greedy(ref_codes, qte, stock, np.argsort(demande[cmd_codes], kind="stable"))
+
+
+def _max_commandes_completes(ref_codes, cmd_codes, qte, stock):
+    # 1er passage tout-ou-rien, commandes les moins gourmandes en stock rare d'abord ;
+    # 2e passage glouton sur le reste pour ne pas laisser de stock inutilisé
+    with np.errstate(divide="ignore", invalid="ignore"):
+        poids = np.where(stock[ref_codes] > 0, qte / stock[ref_codes], np.inf)
+    charge = np.bincount(cmd_codes, weights=np.nan_to_num(poids, posinf=1e12))
+
+    order = np.lexsort((np.arange(len(qte)), charge[cmd_codes]))
+    sorted_cmds = cmd_codes[order]
+    bornes = np.flatnonzero(np.r_[True, sorted_cmds[1:] != sorted_cmds[:-1], True])
+
+    restant = stock.astype(float)
+    complete = np.zeros(len(qte), dtype=bool)
+    for debut, fin in zip(bornes[:-1], bornes[1:]):
+        lignes = order[debut:fin]
+        refs, inverse = np.unique(ref_codes[lignes], return_inverse=True)
+        besoin = np.bincount(inverse, weights=qte[lignes])
+        if np.all(restant[refs] >= besoin):
+            restant[refs] -= besoin
+            complete[lignes] = True
+
+    servi = np.where(complete, qte, 0).astype(float)
+    reste = ~complete
+    servi[reste] = _greedy(ref_codes[reste], qte[reste], restant)
+    return servi
+
+
+def _equitable(ref_codes, cmd_codes, qte, stock):
+    # Réf. en tension : chaque ligne reçoit sa part au prorata de sa demande (arrondi inférieur),
+    # les unités restantes vont aux plus forts restes, puis dans l'ordre de priorité,
+    # et une éventuelle fraction d'unité à la 1re ligne servie qui peut la recevoir
+    demande = np.bincount(ref_codes, weights=qte, minlength=len(stock))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(demande > stock, stock / demande, 1.0)
+    exact = qte * ratio[ref_codes]
+    base = np.floor(exact)
+
+    reste = np.floor(stock - np.bincount(ref_codes, weights=base, minlength=len(stock)))
+    reste = np.where(demande > stock, reste, 0)
+    fraction = exact - base
+
+    order = np.lexsort((np.arange(len(qte)), -fraction, ref_codes))
+    sorted_refs = ref_codes[order]
+    debut = np.flatnonzero(np.r_[True, sorted_refs[1:] != sorted_refs[:-1]])
+    rang = np.arange(len(qte)) - np.repeat(debut, np.diff(np.r_[debut, len(qte)]))
+
+    bonus = np.zeros(len(qte), dtype=bool)
+    bonus[order] = (rang < reste[sorted_refs]) & (fraction[order] > 0)
+    servi = base + bonus
+
+    # Stock fractionnaire (ex. 2,5) : la part non entière restante va aux premières lignes
+    # dans l'ordre de priorité, pour servir tout le stock comme les autres stratégies
+    residu = stock - np.bincount(ref_codes, weights=servi, minlength=len(stock))
+    residu = np.where(demande > stock, residu, 0)
+    return servi + _greedy(ref_codes, qte - servi, residu)
+
+
+STRATEGIES = {
+    "fifo": ("Premier arrivé, premier servi", _fifo),
+    "completes": ("Max commandes complètes", _max_commandes_completes),
+    "taux": ("Max taux par commande", _max_taux_commande),
+    "equitable": ("Partage proportionnel", _equitable),
+}
+# Stratégies où le service d'une réf. ne dépend que de son stock et de ses propres lignes
+PER_REF_STRATEGIES = {"fifo", "equitable"}
+
+
+# --- Allocation ---
+
+def allocate(df_cde, df_stock, priority="commande", strategy="fifo", lookups=None):
+    lignes = allocate_lines(df_cde, df_stock, priority, strategy, lookups)
+    return lignes, aggregate(lignes)
+
+
+def allocate_lines(df_cde, df_stock, priority="commande", strategy="fifo", lookups=None):
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Stratégie inconnue : {strategy}")
+    articles, inventory, descriptions = lookups or stock_lookups(df_stock)
+
+    cde = _service_order(df_cde, priority)
+    refs = cde["Ref"].astype("category")
+    commandes = cde["Commande"].astype("category")
+    qte = cde["Qte_Cde"].to_numpy()
+
+    # Clés entières : une recherche dans le stock par référence distincte, puis indexation par ligne
+    ref_codes = refs.cat.codes.to_numpy()
+    categories = refs.cat.categories
+    stock_pos = articles.get_indexer(categories)
+    # Stock de départ par réf. ; un stock négatif ne permet de rien servir
+    stock = np.clip(inventory[stock_pos], 0, None)
+
+    servi = STRATEGIES[strategy][1](ref_codes, commandes.cat.codes.to_numpy(), qte, stock)
+    if np.array_equal(servi, np.floor(servi)):
+        servi = servi.astype(qte.dtype)
+
+    article = descriptions[stock_pos]
+    missing = stock_pos < 0
+    article[missing] = ["Ref " + str(ref) for ref in categories[missing]]
+
+    lignes = pd.DataFrame({
+        "Commande": commandes.array,
+        "Ref": refs.array,
+        "Article": article[ref_codes],
+        "Commandé": qte,
+        "Servi": servi,
+        "Manquant": qte - servi,
+    }, columns=LINE_COLUMNS)
+
+    return lignes
+
+
+def update_lines(lignes, df_stock, refs, strategy="fifo", lookups=None):
+    # Nouveau stock pour quelques réf. : seules leurs lignes sont recalculées si la stratégie le permet,
+    # sinon nouvelle allocation complète. Les lignes sont déjà dans l'ordre de service.
+    cde = lignes[["Commande", "Ref", "Commandé"]].rename(columns={"Commandé": "Qte_Cde"})
+    if strategy not in PER_REF_STRATEGIES:
+        return allocate_lines(cde, df_stock, "arrivee", strategy, lookups)
+
+    mask = lignes["Ref"].isin(refs).to_numpy()
+    if not mask.any():
+        return lignes
+    sub = allocate_lines(cde[mask], df_stock, "arrivee", strategy, lookups)
+
+    qte = lignes["Commandé"].to_numpy()
+    servi = lignes["Servi"].to_numpy(dtype=float)
+    servi[mask] = sub["Servi"].to_numpy(dtype=float)
+    if np.array_equal(servi, np.floor(servi)):
+        servi = servi.astype(qte.dtype)
+    return lignes.assign(Servi=servi, Manquant=qte - servi)
+
+
+def aggregate(lignes):
+    df_ana = lignes.assign(
+        Lignes_OK=(lignes["Manquant"] == 0).astype(int),
+        Lignes_KO=(lignes["Manquant"] > 0).astype(int),
+    ).groupby("Commande", sort=True, observed=True).agg(
+        Demande=("Commandé", "sum"),
+        Servi=("Servi", "sum"),
+        Lignes_OK=("Lignes_OK", "sum"),
+        Lignes_KO=("Lignes_KO", "sum"),
+    ).reset_index()
+
+    demande = df_ana["Demande"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df_ana["Taux"] = np.where(demande > 0, df_ana["Servi"] / demande * 100, 0.0)
+
+    return df_ana[["Commande", "Taux", "Demande", "Servi", "Lignes_OK", "Lignes_KO"]]
+
+
+def kpis(df_ana):
+    # Indicateurs des cartes KPI, plus ceux qui départagent les stratégies
+    demande, servi = df_ana["Demande"].sum(), df_ana["Servi"].sum()
+    return {
+        "Commandes": len(df_ana),
+        "Complètes": int((df_ana["Taux"] == 100).sum()),
+        "Taux": float(servi / demande * 100) if demande > 0 else 0.0,
+        "Taux moyen": float(df_ana["Taux"].mean()) if len(df_ana) else 0.0,
+        "Livrés": int(servi),
+        "Manquants": int(demande - servi),
+    }
@@ -0,0 +1,153 @@
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from cache import ARROW_AVAILABLE
+
+if ARROW_AVAILABLE:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+# Résultats de chaque analyse en Parquet, partitionnés par jour, en trois jeux :
+#   lignes/date=2025-06-01/<id>.parquet   détail ligne à ligne (Commande, Ref, Commandé, Servi, Manquant)
+#   refs/date=.../<id>.parquet            une ligne par réf. et par analyse
+#   runs/date=.../<id>.parquet            une ligne par analyse
+# Les requêtes lisent les agrégats (refs, runs) : quelques centaines de milliers de lignes
+# pour une année d'analyses quotidiennes, au lieu de millions.
+ANALYTICS_DIR = Path(os.environ.get("GESTHOR_ANALYTICS_DIR", "gesthor_analytics"))
+LINE_COLUMNS = ["Commande", "Ref", "Commandé", "Servi", "Manquant"]
+
+if ARROW_AVAILABLE:
+    # Schémas fixes : tous les fichiers d'un jeu se lisent ensemble
+    SCHEMAS = {
+        "lignes": pa.schema([
+            ("run", pa.string()), ("Commande", pa.string()), ("Ref", pa.string()),
+            ("Commandé", pa.float64()), ("Servi", pa.float64()), ("Manquant", pa.float64()),
+        ]),
+        "refs": pa.schema([
+            ("run", pa.string()), ("Ref", pa.string()),
+            ("Commandé", pa.float64()), ("Servi", pa.float64()), ("Manquant", pa.float64()),
+        ]),
+        "runs": pa.schema([
+            ("run", pa.string()), ("timestamp", pa.timestamp("s")), ("user", pa.string()),
+            ("Commandes", pa.int64()), ("Lignes", pa.int64()), ("Lignes_KO", pa.int64()),
+            ("Demande", pa.float64()), ("Servi", pa.float64()),
+        ]),
+    }
+    PARTITION = pa.schema([("date", pa.string())])
+
+
+def _write(directory, name, date, run_id, df):
+    partition = Path(directory) / name / f"date={date}"
+    partition.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(df[SCHEMAS[name].names], schema=SCHEMAS[name], preserve_index=False)
+    # Préfixe "." : ignoré par les lectures tant que l'écriture n'est pas terminée
+    tmp = partition / f".{run_id}.tmp"
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, partition / f"{run_id}.parquet")
+
+
+def record_run(lignes, user=None, timestamp=None, directory=ANALYTICS_DIR):
+    if not ARROW_AVAILABLE or lignes.empty:
+        return None
+    timestamp = timestamp or datetime.now()
+    date = timestamp.strftime("%Y-%m-%d")
+    run_id = f"{timestamp.strftime('%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    df = lignes[LINE_COLUMNS].astype({"Commande": str, "Ref": str, "Commandé": float, "Servi": float, "Manquant": float})
+    df = df.assign(run=run_id)
+    refs = df.groupby("Ref", sort=False).agg(
+        Commandé=("Commandé", "sum"), Servi=("Servi", "sum"), Manquant=("Manquant", "sum")
+    ).reset_index().assign(run=run_id)
+    run = pd.DataFrame([{
+        "run": run_id,
+        "timestamp": pd.Timestamp(timestamp).floor("s"),
+        "user": user,
+        "Commandes": df["Commande"].nunique(),
+        "Lignes": len(df),
+        "Lignes_KO": int((df["Manquant"] > 0).sum()),
+        "Demande": df["Commandé"].sum(),
+        "Servi": df["Servi"].sum(),
+    }])
+
+    # runs en dernier : le taux de service par jour (runs) ne compte une analyse qu'une fois son détail écrit.
+    # Les requêtes par réf. (refs) peuvent la voir un instant plus tôt, entre les deux écritures.
+    _write(directory, "lignes", date, run_id, df)
+    _write(directory, "refs", date, run_id, refs)
+    _write(directory, "runs", date, run_id, run)
+    return run_id
+
+
+def load(name, columns, since=None, until=None, condition=None, directory=ANALYTICS_DIR):
+    # since / until : dates "YYYY-MM-DD" incluses ; élagage des partitions hors période
+    path = Path(directory) / name
+    if not ARROW_AVAILABLE or not path.exists():
+        return None
+    dataset = ds.dataset(
+        path, format="parquet", schema=pa.unify_schemas([SCHEMAS[name], PARTITION]),
+        partitioning=ds.partitioning(PARTITION, flavor="hive"),
+    )
+    if since is not None:
+        condition = (ds.field("date") >= since) if condition is None else condition & (ds.field("date") >= since)
+    if until is not None:
+        condition = (ds.field("date") <= until) if condition is None else condition & (ds.field("date") <= until)
+    return dataset.to_table(columns=["date"] + columns, filter=condition)
+
+
+# --- Requêtes ---
+# Agrégation côté Arrow (group_by) : seul le résultat, petit, passe en pandas
+
+def fill_rate_by_day(since=None, until=None, directory=ANALYTICS_DIR):
+    columns = ["date", "Analyses", "Demande", "Servi", "Lignes_KO", "Taux"]
+    table = load("runs", ["run", "Demande", "Servi", "Lignes_KO"], since, until, directory=directory)
+    if table is None or not table.num_rows:
+        return pd.DataFrame(columns=columns)
+    jours = table.group_by("date").aggregate([
+        ("run", "count"), ("Demande", "sum"), ("Servi", "sum"), ("Lignes_KO", "sum"),
+    ]).to_pandas().rename(columns={
+        "run_count": "Analyses", "Demande_sum": "Demande", "Servi_sum": "Servi", "Lignes_KO_sum": "Lignes_KO",
+    })
+    jours["Taux"] = (jours["Servi"] / jours["Demande"].where(jours["Demande"] > 0) * 100).fillna(0.0)
+    return jours.sort_values("date")[columns].reset_index(drop=True)
+
+
+def shortages_by_ref(since=None, until=None, limit=20, min_runs=1, directory=ANALYTICS_DIR):
+    # Réf. le plus souvent en rupture : analyses où la réf. manque, sur celles où elle est commandée
+    columns = ["Ref", "Analyses", "Ruptures", "Fréquence", "Jours", "Manquant", "Dernière"]
+    table = load("refs", ["Ref", "Manquant"], since, until, directory=directory)
+    if table is None or not table.num_rows:
+        return pd.DataFrame(columns=columns)
+
+    # Une ligne par réf. et par analyse : compter les lignes = compter les analyses
+    commandee = table.group_by("Ref").aggregate([("Ref", "count")])
+    manque = table.filter(pc.greater(table["Manquant"], 0))
+    ruptures = manque.group_by("Ref").aggregate([("Ref", "count"), ("Manquant", "sum"), ("date", "max")])
+    jours = manque.group_by(["Ref", "date"]).aggregate([]).group_by("Ref").aggregate([("date", "count")])
+
+    out = (
+        ruptures.to_pandas()
+        .rename(columns={"Ref_count": "Ruptures", "Manquant_sum": "Manquant", "date_max": "Dernière"})
+        .merge(jours.to_pandas().rename(columns={"date_count": "Jours"}), on="Ref")
+        .merge(commandee.to_pandas().rename(columns={"Ref_count": "Analyses"}), on="Ref")
+    )
+    out["Fréquence"] = out["Ruptures"] / out["Analyses"] * 100
+    out = out[out["Ruptures"] >= min_runs]
+    out = out.sort_values(["Ruptures", "Manquant", "Ref"], ascending=[False, False, True])
+    return out[columns].head(limit).reset_index(drop=True)
+
+
+def ref_by_day(ref, since=None, until=None, directory=ANALYTICS_DIR):
+    # Historique d'une réf. : demande, servi et manquant par jour
+    columns = ["date", "Commandé", "Servi", "Manquant"]
+    table = load("refs", columns[1:], since, until, ds.field("Ref") == str(ref), directory)
+    if table is None or not table.num_rows:
+        return pd.DataFrame(columns=columns)
+    jours = table.group_by("date").aggregate([(c, "sum") for c in columns[1:]]).to_pandas()
+    jours = jours.rename(columns={f"{c}_sum": c for c in columns[1:]})
+    return jours.sort_values("date")[columns].reset_index(drop=True)
+
@@ -1,25 +1,39 @@
+import time
+_T_START = time.perf_counter()
+
+import importlib.util
+import sys
+from datetime import datetime, timedelta
+from functools import partial
+
 import streamlit as st
-import pandas as pd
-import numpy as np
-import pdfplumber
-import re
-import io
-import json
-from datetime import datetime
-from pathlib import Path
+
+import history as history_store
+import metrics
+
+# pandas, pdfplumber, openpyxl… ne sont importés qu'une fois un fichier stock chargé
+# (voir "--- MAIN ---") : la page de connexion n'en a pas besoin
 
 # --- Vérification Plotly ---
-try:
-    import plotly.graph_objects as go
-    PLOTLY_AVAILABLE = True
-except ImportError:
-    PLOTLY_AVAILABLE = False
+# Simple recherche du module : l'import n'a lieu qu'au premier graphique
+PLOTLY_AVAILABLE = importlib.util.find_spec("plotly") is not None
+# Stock en direct depuis BC : nécessite Playwright (scraper.py)
+LIVE_AVAILABLE = importlib.util.find_spec("playwright") is not None
 
 # --- Configuration ---
 st.set_page_config(page_title="GESTHOR", page_icon="📦", layout="wide")
 
-# --- Fichier de sauvegarde ---
-HISTORY_FILE = "gesthor_history.json"
+# Nombre de commandes détaillées par page (section "📋 Détail")
+DETAIL_PAGE_SIZES = [10, 25, 50]
+# Rafraîchissement de l'avancement d'une analyse en arrière-plan (s)
+JOB_POLL_S = 1
+# Libellés des étapes des tâches (jobs.py)
+JOB_STAGES = {
+    "extraction": "📄 Lecture des PDF", "allocation": "⚙️ Allocation", "agrégats": "📊 Agrégats",
+    "export": "📥 Export Excel", "stock_bc": "🔄 Relevé du stock BC",
+}
+# Périodes proposées dans l'onglet "📈 Tendances" (jours)
+TREND_PERIODS = {"30 jours": 30, "Trimestre": 91, "Année": 365}
 
 USERS_DB = {
     "admin": {"password": "admin123", "role": "admin"},
@@ -95,131 +109,97 @@ if not st.session_state.authenticated:
                 else:
                     st.error("❌ Identifiant ou mot de passe incorrect")
         st.info("💡 **Demo**: user1 / user123")
+    metrics.record_duration("page_connexion", _T_START)
     st.stop()
 
 # --- FONCTIONS ---
 
-def load_history():
+def load_history(limit=None):
     try:
-        if Path(HISTORY_FILE).exists():
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return []
-    except:
+        with metrics.measure("historique", st.session_state.username) as m:
+            entries = history_store.query(limit=limit)
+            m["rows"] = len(entries)
+        return entries
+    except Exception:
         return []
 
-def save_history(history):
+def clear_history():
     try:
-        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
+        history_store.purge()
     except Exception as e:
         st.error(f"Erreur sauvegarde : {e}")
 
 def add_to_history(analysis_data):
-    history = load_history()
-    analysis_data['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    analysis_data['user'] = st.session_state.username
-    history.append(analysis_data)
-    if len(history) > 50:
-        history = history[-50:]
-    save_history(history)
+    try:
+        history_store.add_entry(analysis_data, st.session_state.username)
+    except Exception as e:
+        st.error(f"Erreur sauvegarde : {e}")
+
+def record_analysis(lignes):
+    # Détail ligne à ligne de l'analyse pour les tendances (analytics.py)
+    try:
+        with metrics.measure("tendances_ecriture", st.session_state.username, rows=len(lignes)):
+            analytics.record_run(lignes, st.session_state.username)
+        load_trends.clear()
+    except Exception as e:
+        st.error(f"Erreur sauvegarde tendances : {e}")
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_trends(since):
+    # Mémoïsé par période ; vidé à chaque nouvelle analyse de cette instance
+    with metrics.measure("tendances"):
+        return analytics.fill_rate_by_day(since), analytics.shortages_by_ref(since, limit=50)
 
-@st.cache_data
 def load_stock(file):
     try:
-        df = pd.read_excel(file)
-        col_map = {c: c.strip() for c in df.columns}
-        df = df.rename(columns=col_map)
-        
-        if "N° article." in df.columns:
-            df["N° article."] = df["N° article."].astype(str).str.strip()
-        if "Description" in df.columns:
-            df["Description"] = df["Description"].astype(str).str.strip()
-        
-        df["Inventory"] = pd.to_numeric(df["Inventory"], errors='coerce').fillna(0)
-        df["Qty. per Sales Unit of Measure"] = pd.to_numeric(
-            df["Qty. per Sales Unit of Measure"], errors='coerce'
-        ).fillna(1)
-        
-        df["Stock Colis"] = df["Inventory"] / df["Qty. per Sales Unit of Measure"].replace(0, 1)
-        
-        conditions = [(df["Inventory"] <= 0), (df["Inventory"] < 500)]
-        choices = ["Rupture", "Faible"]
-        df["Statut"] = np.select(conditions, choices, default="OK")
-        
-        return df
+        with metrics.measure("stock", st.session_state.username) as m:
+            key, df = pipeline.stock_stage(file)
+            m["rows"] = len(df)
+        return key, df
     except Exception as e:
         st.error(f"Erreur Excel : {e}")
-        return None
+        return None, None
 
-def extract_pdf_improved(pdf_file):
-    orders = []
+def submit_analysis(pdf_files, stock_key, df_stock, priority, strategy):
+    # Analyse en arrière-plan, partagée par les sessions qui soumettent les mêmes fichiers et options
+    # -> (tâche, PDF, clés des PDF)
     try:
-        with pdfplumber.open(pdf_file) as pdf:
-            full_text = ""
-            for page in pdf.pages:
-                full_text += page.extract_text() + "\n---PAGE---\n"
-            
-            cmd_pattern = re.compile(r"Commande\s+n[°º]?\s*(\d{5,10})", re.IGNORECASE)
-            cmd_matches = list(cmd_pattern.finditer(full_text))
-            
-            if not cmd_matches:
-                return pd.DataFrame()
-            
-            cmd_positions = {match.start(): match.group(1) for match in cmd_matches}
-            cmd_starts = sorted(cmd_positions.keys())
-            
-            line_pattern = re.compile(
-                r'^\s*(\d{1,3})\s+(\d{3,7})\s+(\d{13})\s+(\d{1,4})\s+(.+?)\s+(\d{1,5})\s+(\d{1,4})\s+(?:EUR|\d+[,\.]\d+)',
-                re.MULTILINE
-            )
-            
-            for match in line_pattern.finditer(full_text):
-                try:
-                    pos = match.start()
-                    ref = match.group(2).strip()
-                    qty = int(match.group(6).strip())
-                    
-                    current_cmd = "INCONNU"
-                    for start_pos in cmd_starts:
-                        if start_pos <= pos:
-                            current_cmd = cmd_positions[start_pos]
-                        else:
-                            break
-                    
-                    orders.append({"Commande": current_cmd, "Ref": ref, "Qte_Cde": qty})
-                except:
-                    continue
-            
-            if len(orders) < 5:
-                alt_pattern = re.compile(
-                    r'^\s*\d{1,3}\s+(\d{3,7})\s+\d{13}\s+.{10,200}?\s(\d{1,5})\s+\d{1,4}\s+(?:EUR|\d+[,\.]\d+)',
-                    re.MULTILINE | re.DOTALL
-                )
-                
-                for match in alt_pattern.finditer(full_text):
-                    try:
-                        pos = match.start()
-                        ref = match.group(1).strip()
-                        qty = int(match.group(2).strip())
-                        
-                        current_cmd = "INCONNU"
-                        for start_pos in cmd_starts:
-                            if start_pos <= pos:
-                                current_cmd = cmd_positions[start_pos]
-                            else:
-                                break
-                        
-                        orders.append({"Commande": current_cmd, "Ref": ref, "Qte_Cde": qty})
-                    except:
-                        continue
-            
-            if orders:
-                return pd.DataFrame(orders).drop_duplicates()
-            return pd.DataFrame()
+        pdfs = list(collect_pdfs(pdf_files))
+        keys = [orders_key(pdf) for pdf in pdfs]
+        key = jobs.analysis_key(stock_key, keys, priority, strategy)
+        job = jobs.JOBS.get(key) or jobs.JOBS.submit(
+            key, jobs.ANALYSIS_STAGES, jobs.analysis_job,
+            stock_key, df_stock, [jobs.detach(pdf) for pdf in pdfs], keys, priority, strategy, st.session_state.username
+        )
+        return job, pdfs, keys
     except Exception as e:
         st.error(f"Erreur PDF : {e}")
-        return pd.DataFrame()
+        return None, [], []
+
+@st.fragment(run_every=JOB_POLL_S)
+def show_job_progress(job):
+    # Seul ce fragment est réexécuté pendant le calcul ; rerun complet une fois la tâche terminée
+    if not job.running:
+        st.rerun()
+    stage, done, total = job.progress
+    detail = f" – page {done}/{total}" if total else ""
+    st.progress(job.fraction, text=f"{JOB_STAGES.get(stage, '⏳ En attente')}{detail} ({time.time() - job.submitted:.0f} s)")
+
+def sync_live_stock(refs):
+    # Relevé BC des seules réf. jamais lues ou périmées, en arrière-plan : None si rien à relire
+    stale = live.LIVE_STOCK.stale(refs)
+    if not stale:
+        return None
+    key = ("stock_bc", *stale)
+    job = jobs.JOBS.get(key)
+    if job is not None and job.error is not None:
+        # Erreur affichée une fois, puis oubliée : le prochain rerun retente le relevé
+        jobs.JOBS.discard(key)
+        return job
+    if job is not None and not job.running:
+        # Relevé terminé mais réf. de nouveau périmées (TTL écoulé) : on relance
+        jobs.JOBS.discard(key)
+    return jobs.JOBS.submit(key, jobs.LIVE_STAGES, jobs.live_sync_job, stale, st.session_state.username)
 
 # --- SIDEBAR ---
 with st.sidebar:
@@ -234,7 +214,7 @@ with st.sidebar:
     
     st.markdown("### 📁 Fichiers")
     f_stock = st.file_uploader("📊 Stock Excel", type=["xlsx"])
-    f_pdf = st.file_uploader("📄 Commandes PDF", type=["pdf"])
+    f_pdf = st.file_uploader("📄 Commandes PDF", type=["pdf", "zip"], accept_multiple_files=True)
     
     st.divider()
     
@@ -267,11 +247,11 @@ with st.sidebar:
     st.divider()
     
     st.markdown("### 📊 Historique")
-    history = load_history()
+    history = load_history(limit=10)
     
     if history:
         nb = st.slider("Afficher", 3, 10, 5)
-        for entry in reversed(history[-nb:]):
+        for entry in history[:nb]:
             with st.expander(f"📅 {entry['timestamp'][:16]}"):
                 st.write(f"👤 {entry.get('user', 'N/A')}")
                 st.write(f"📦 {entry.get('nb_commandes', 0)} cde")
@@ -280,24 +260,79 @@ with st.sidebar:
         st.info("Aucun historique")
     
     if st.button("🗑️ Effacer", use_container_width=True):
-        save_history([])
+        clear_history()
         st.success("Effacé")
         st.rerun()
+    
+    if st.session_state.user_role == "admin":
+        st.divider()
+        
+        st.markdown("### ⏱️ Performances")
+        mesures = metrics.recent(limit=50)
+        if mesures:
+            import pandas as pd
+            df_metrics = pd.DataFrame(mesures)
+            par_etape = df_metrics.groupby("stage", sort=False).agg(
+                Dernier=("duration_s", "first"),
+                Moyenne=("duration_s", "mean"),
+                Lignes=("rows", "first"),
+                Appels=("duration_s", "size"),
+            )
+            st.dataframe(
+                par_etape.style.format({"Dernier": "{:.3f} s", "Moyenne": "{:.3f} s", "Lignes": "{:.0f}"}, na_rep="–"),
+                use_container_width=True
+            )
+            with st.expander("📜 Détail"):
+                st.dataframe(
+                    df_metrics[["timestamp", "stage", "user", "status", "duration_s", "rows", "rss_mb", "peak_rss_mb", "peak_delta_mb"]],
+                    hide_index=True,
+                    use_container_width=True
+                )
+            st.caption(f"Journal : {metrics.METRICS_LOG}")
+        else:
+            st.info("Aucune mesure")
+        
+        # Analyses en arrière-plan (jobs.py), tous utilisateurs confondus
+        if "jobs" in sys.modules:
+            en_cours = sys.modules["jobs"].JOBS.running()
+            st.caption(f"Tâches en arrière-plan : {len(en_cours)} en cours")
+        
+        # Cache d'étapes partagé : présent dès qu'un fichier a été chargé dans ce processus
+        if "pipeline" in sys.modules:
+            import pandas as pd
+            cache = sys.modules["pipeline"].STAGES
+            st.caption(f"Cache partagé : {cache.nbytes / (1 << 20):.0f} / {cache.max_bytes >> 20} Mo")
+            with st.expander("🗄️ Cache"):
+                st.dataframe(
+                    pd.DataFrame(
+                        [(stage, n, size / (1 << 20)) for stage, (n, size) in cache.stats().items()],
+                        columns=["Étape", "Entrées", "Mo"]
+                    ).style.format({"Mo": "{:.1f}"}),
+                    hide_index=True,
+                    use_container_width=True
+                )
 
 # --- MAIN ---
 if f_stock:
-    df_stock = load_stock(f_stock)
+    import pandas as pd
+    
+    from allocation import PRIORITIES, STRATEGIES, kpis
+    import analytics
+    from export import XLSX_MIME
+    from extraction import collect_pdfs, orders_key
+    import jobs
+    import live
+    import pipeline
+    
+    stock_key, df_stock = load_stock(f_stock)
     
     if df_stock is None:
         st.stop()
     
-    df = df_stock.copy()
+    # Stock partagé entre sessions (pipeline.STAGES) : lu tel quel, jamais modifié sur place
+    df = df_stock
     if st.session_state.current_search:
-        mask = (
-            df["N° article."].str.contains(st.session_state.current_search, case=False, na=False) |
-            df["Description"].str.contains(st.session_state.current_search, case=False, na=False)
-        )
-        df = df[mask]
+        df = df.iloc[pipeline.search_index_stage(stock_key, df_stock).search(st.session_state.current_search)]
         if not df.empty:
             st.success(f"🎯 {len(df)} résultat(s) pour '{st.session_state.current_search}'")
         else:
@@ -316,7 +351,7 @@ if f_stock:
     tabs_list = []
     if f_pdf:
         tabs_list.append("🚀 Commandes")
-    tabs_list.extend(["❌ Ruptures", "⚠️ Faible", "✅ OK", "📋 Tout"])
+    tabs_list.extend(["❌ Ruptures", "⚠️ Faible", "✅ OK", "📋 Tout", "📈 Tendances"])
     
     tabs = st.tabs(tabs_list)
     
@@ -325,58 +360,66 @@ if f_stock:
         with tabs[0]:
             st.subheader("📊 Analyse")
             
-            df_cde = extract_pdf_improved(f_pdf)
+            col1, col2 = st.columns(2)
+            with col1:
+                priority = st.selectbox(
+                    "Priorité",
+                    list(PRIORITIES),
+                    format_func=PRIORITIES.get,
+                    help="Ordre de service des commandes quand le stock ne suffit pas"
+                )
+            with col2:
+                strategy = st.selectbox(
+                    "Stratégie",
+                    list(STRATEGIES),
+                    format_func=lambda s: STRATEGIES[s][0],
+                    help="Répartition du stock rare entre les commandes"
+                )
+            
+            # Lecture des PDF et allocation en arrière-plan : les autres onglets restent utilisables
+            job, pdfs, keys = submit_analysis(f_pdf, stock_key, df_stock, priority, strategy)
+            analyse = None
+            if job is not None and not job.running and job.error is None:
+                analyse = jobs.analysis_results(stock_key, df_stock, pdfs, keys, priority, strategy)
             
-            if df_cde.empty:
+            if job is not None and job.running:
+                show_job_progress(job)
+            elif job is not None and job.error is not None:
+                st.error(f"Erreur PDF : {job.error}")
+                if st.button("🔁 Relancer"):
+                    jobs.JOBS.discard(job.key)
+                    st.rerun()
+            elif analyse is not None and analyse["df_cde"].empty:
                 st.warning("Aucune donnée PDF")
-            else:
-                stock_live = df_stock.set_index("N° article.")["Inventory"].to_dict()
-                desc_live = df_stock.set_index("N° article.")["Description"].to_dict()
-                
-                analyse = []
-                all_ruptures = []
-                all_livres = []
+            elif analyse is not None:
+                cde_key, df_cde, doublons = analyse["orders_key"], analyse["df_cde"], analyse["doublons"]
+                allocation_key, lignes, df_ana = analyse["allocation_key"], analyse["lignes"], analyse["df_ana"]
+                if doublons:
+                    st.info(f"ℹ️ {len(doublons)} commande(s) présente(s) dans plusieurs fichiers, gardée(s) une seule fois : {', '.join(doublons[:10])}")
                 
-                for num_cde, data_cde in df_cde.groupby("Commande"):
-                    tot_demande, tot_servi = 0, 0
-                    lignes_ko, lignes_ok = [], []
-                    
-                    for _, row in data_cde.iterrows():
-                        ref, qte = row["Ref"], row["Qte_Cde"]
-                        stock_dispo = stock_live.get(ref, 0)
-                        
-                        tot_demande += qte
-                        servi = min(qte, stock_dispo)
-                        tot_servi += servi
-                        stock_live[ref] = max(0, stock_dispo - servi)
-                        
-                        item = {
-                            "Commande": num_cde,
-                            "Ref": ref,
-                            "Article": desc_live.get(ref, f"Ref {ref}"),
-                            "Commandé": qte,
-                            "Servi": servi,
-                            "Manquant": qte - servi
-                        }
-                        
-                        if servi < qte:
-                            lignes_ko.append(item)
-                            all_ruptures.append(item)
-                        else:
-                            lignes_ok.append(item)
-                            all_livres.append(item)
+                # Stock en direct : seules les réf. commandées sont relevées, seules leurs lignes recalculées
+                alloc_stock_key, alloc_stock = stock_key, df_stock
+                if LIVE_AVAILABLE and st.toggle(
+                    "🔄 Stock BC en direct",
+                    help=f"Relève dans BC l'inventaire des réf. commandées (relu au-delà de {live.LIVE_STOCK.ttl // 60} min)"
+                ):
+                    refs = df_cde["Ref"].astype(str).unique()
+                    # Pendant le relevé, l'analyse s'affiche avec les inventaires déjà connus
+                    sync = sync_live_stock(refs)
+                    if sync is not None and sync.running:
+                        show_job_progress(sync)
+                    elif sync is not None and sync.error is not None:
+                        st.error(f"Erreur BC : {sync.error}")
+                    alloc_stock_key, (alloc_stock, changed) = pipeline.live_stock_stage(stock_key, df_stock)
+                    allocation_key, lignes = pipeline.live_allocation_stage(
+                        allocation_key, lignes, alloc_stock_key, alloc_stock, changed, strategy
+                    )
+                    df_ana = pipeline.aggregate_stage(allocation_key, lignes)
                     
-                    taux = (tot_servi / tot_demande * 100) if tot_demande > 0 else 0
-                    analyse.append({
-                        "Commande": num_cde,
-                        "Taux": taux,
-                        "Demande": tot_demande,
-                        "Servi": tot_servi,
-                        "Alertes": lignes_ko,
-                        "Livres": lignes_ok
-                    })
-                
-                df_ana = pd.DataFrame(analyse)
+                    releves = live.LIVE_STOCK.fetched_at(refs)
+                    if releves:
+                        plus_ancien = datetime.fromtimestamp(min(releves.values())).strftime("%H:%M")
+                        st.caption(f"🔄 {len(releves)}/{len(refs)} réf. relevées dans BC (plus ancien relevé : {plus_ancien}), {len(set(changed).intersection(refs))} stock(s) différent(s) de l'Excel")
                 
                 tot_demande_g = df_ana["Demande"].sum()
                 tot_servi_g = df_ana["Servi"].sum()
@@ -417,16 +460,35 @@ if f_stock:
                     </div>
                     """, unsafe_allow_html=True)
                 
-                add_to_history({
-                    'nb_commandes': len(df_ana),
-                    'taux_global': taux_global,
-                    'total_demande': int(tot_demande_g),
-                    'total_servi': int(tot_servi_g)
-                })
+                # Historique : une entrée par analyse (stock + commandes) et par utilisateur ; tendances :
+                # une seule par analyse pour tout le processus. Ni les reruns, ni les changements de
+                # priorité / stratégie, ni le stock BC en direct n'en ajoutent.
+                # Résultats de la 1re allocation affichée, sur le stock Excel.
+                if jobs.claim_record(stock_key, cde_key, "historique", st.session_state.username):
+                    base = kpis(analyse["df_ana"])
+                    add_to_history({
+                        'nb_commandes': base["Commandes"],
+                        'taux_global': base["Taux"],
+                        'total_demande': base["Livrés"] + base["Manquants"],
+                        'total_servi': base["Livrés"]
+                    })
+                if jobs.claim_record(stock_key, cde_key, "tendances"):
+                    record_analysis(analyse["lignes"])
+                
+                if st.toggle("⚖️ Comparer les stratégies"):
+                    df_strat = pipeline.strategies_stage(alloc_stock_key, alloc_stock, cde_key, df_cde, priority)
+                    st.dataframe(
+                        df_strat.style.format({"Taux": "{:.1f}%", "Taux moyen": "{:.1f}%"}),
+                        hide_index=True,
+                        use_container_width=True
+                    )
+                    st.caption("Le taux global est identique pour toutes les stratégies : seule la répartition entre commandes change.")
                 
                 st.markdown("---")
                 
                 if PLOTLY_AVAILABLE:
+                    import plotly.graph_objects as go
+                    
                     st.markdown("### 📈 Performance")
                     df_plot = df_ana.sort_values("Taux", ascending=True)
                     
@@ -454,11 +516,13 @@ if f_stock:
                 st.markdown("---")
                 st.markdown("### 📋 Détail")
                 
-                col1, col2 = st.columns(2)
+                col1, col2, col3 = st.columns(3)
                 with col1:
                     mode = st.radio("Vue", ["🔴 Problèmes", "🟢 OK", "📊 Tout"], horizontal=True)
                 with col2:
                     sort = st.selectbox("Tri", ["Taux ↑", "Taux ↓", "N° cde"])
+                with col3:
+                    layout = st.radio("Affichage", ["📂 Par commande", "📄 Lignes"], horizontal=True)
                 
                 if sort == "Taux ↑":
                     df_display = df_ana.sort_values("Taux")
@@ -472,68 +536,111 @@ if f_stock:
                 elif mode == "🟢 OK":
                     df_display = df_display[df_display["Taux"] == 100]
                 
-                for _, row in df_display.iterrows():
-                    taux = row['Taux']
-                    icon = "✅" if taux == 100 else "⚠️" if taux >= 95 else "❌"
+                if layout == "📄 Lignes":
+                    # Vue à plat : un seul tableau (virtualisé côté navigateur) au lieu d'un expander par commande
+                    filtre = st.text_input("Filtrer", placeholder="Commande, réf. ou article…", key="detail_filter")
+                    vue = lignes[lignes["Commande"].isin(df_display["Commande"])]
+                    if filtre:
+                        mask = (
+                            vue["Commande"].str.contains(filtre, case=False, regex=False) |
+                            vue["Ref"].str.contains(filtre, case=False, regex=False) |
+                            vue["Article"].str.contains(filtre, case=False, regex=False)
+                        )
+                        vue = vue[mask]
+                    ordre = pd.Index(df_display["Commande"]).get_indexer(vue["Commande"])
+                    vue = vue.iloc[ordre.argsort(kind="stable")]
+                    st.caption(f"{len(vue)} ligne(s)")
+                    st.dataframe(vue, hide_index=True, use_container_width=True)
+                
+                else:
+                    # Pagination : le nombre d'expanders rendus reste borné quel que soit le PDF
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        page_size = st.selectbox("Commandes par page", DETAIL_PAGE_SIZES, key="detail_page_size")
+                    nb_pages = max(1, -(-len(df_display) // page_size))
+                    if st.session_state.get("detail_page", 1) > nb_pages:
+                        st.session_state.detail_page = 1
+                    with col2:
+                        page = st.number_input("Page", min_value=1, max_value=nb_pages, step=1, key="detail_page")
                     
-                    with st.expander(f"{icon} Cde {row['Commande']} – {taux:.1f}% ({int(row['Servi'])}/{int(row['Demande'])})", expanded=(taux < 100)):
-                        sub = st.tabs([f"🟢 Livrés ({len(row['Livres'])})", f"🔴 Manquants ({len(row['Alertes'])})"])
-                        
-                        with sub[0]:
-                            if row["Livres"]:
-                                st.dataframe(
-                                    pd.DataFrame(row["Livres"])[["Ref", "Article", "Commandé", "Servi"]],
-                                    hide_index=True,
-                                    use_container_width=True
-                                )
-                            else:
-                                st.info("Aucun")
+                    df_page = df_display.iloc[(page - 1) * page_size:page * page_size]
+                    if len(df_display):
+                        st.caption(f"Commandes {(page - 1) * page_size + 1}–{(page - 1) * page_size + len(df_page)} sur {len(df_display)}")
+                    
+                    lignes_page = lignes[lignes["Commande"].isin(df_page["Commande"])]
+                    lignes_par_cde = dict(tuple(lignes_page.groupby("Commande", sort=False, observed=True)))
+                    
+                    for _, row in df_page.iterrows():
+                        taux = row['Taux']
+                        icon = "✅" if taux == 100 else "⚠️" if taux >= 95 else "❌"
                         
-                        with sub[1]:
-                            if row["Alertes"]:
-                                st.dataframe(
-                                    pd.DataFrame(row["Alertes"])[["Ref", "Article", "Commandé", "Servi", "Manquant"]],
-                                    hide_index=True,
-                                    use_container_width=True
-                                )
-                            else:
-                                st.success("✅ RAS")
+                        with st.expander(f"{icon} Cde {row['Commande']} – {taux:.1f}% ({int(row['Servi'])}/{int(row['Demande'])})", expanded=(taux < 100)):
+                            sub = st.tabs([f"🟢 Livrés ({row['Lignes_OK']})", f"🔴 Manquants ({row['Lignes_KO']})"])
+                            lignes_cde = lignes_par_cde[row["Commande"]]
+                            
+                            with sub[0]:
+                                if row["Lignes_OK"]:
+                                    st.dataframe(
+                                        lignes_cde[lignes_cde["Manquant"] == 0][["Ref", "Article", "Commandé", "Servi"]],
+                                        hide_index=True,
+                                        use_container_width=True
+                                    )
+                                else:
+                                    st.info("Aucun")
+                            
+                            with sub[1]:
+                                if row["Lignes_KO"]:
+                                    st.dataframe(
+                                        lignes_cde[lignes_cde["Manquant"] > 0][["Ref", "Article", "Commandé", "Servi", "Manquant"]],
+                                        hide_index=True,
+                                        use_container_width=True
+                                    )
+                                else:
+                                    st.success("✅ RAS")
                 
                 st.markdown("---")
                 st.markdown("### 📥 Export")
                 
+                # Fichiers générés seulement au clic (puis mémoïsés par clé d'analyse)
                 col1, col2 = st.columns(2)
                 
                 with col1:
-                    output = io.BytesIO()
                     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
                     
-                    with pd.ExcelWriter(output, engine="openpyxl") as w:
-                        df_recap = df_ana[["Commande", "Taux", "Demande", "Servi"]].copy()
-                        df_recap["Manquant"] = df_recap["Demande"] - df_recap["Servi"]
-                        df_recap.to_excel(w, sheet_name="Recap", index=False)
-                        
-                        if all_livres:
-                            pd.DataFrame(all_livres).to_excel(w, sheet_name="Livres", index=False)
-                        
-                        if all_ruptures:
-                            pd.DataFrame(all_ruptures).to_excel(w, sheet_name="Ruptures", index=False)
-                    
-                    st.download_button(
-                        "📊 Excel",
-                        output.getvalue(),
-                        f"GESTHOR_{ts}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        use_container_width=True
-                    )
+                    # Classeur préparé en arrière-plan, seulement à la demande ; relu ensuite dans le cache d'étapes
+                    export_key = ("export", allocation_key)
+                    export = jobs.JOBS.get(export_key)
+                    if export is None:
+                        if st.button("📊 Préparer l'export Excel", use_container_width=True):
+                            jobs.JOBS.submit(
+                                export_key, jobs.EXPORT_STAGES, jobs.export_job,
+                                allocation_key, df_ana, lignes, st.session_state.username
+                            )
+                            st.rerun()
+                    elif export.running:
+                        show_job_progress(export)
+                    elif export.error is not None:
+                        st.error(f"Erreur export : {export.error}")
+                        if st.button("🔁 Relancer l'export"):
+                            jobs.JOBS.discard(export_key)
+                            st.rerun()
+                    else:
+                        st.download_button(
+                            "📊 Excel",
+                            partial(pipeline.export_stage, allocation_key, df_ana, lignes),
+                            f"GESTHOR_{ts}.xlsx",
+                            mime=XLSX_MIME,
+                            on_click="ignore",
+                            use_container_width=True
+                        )
                 
                 with col2:
-                    csv = df_cde.to_csv(index=False).encode('utf-8')
                     st.download_button(
                         "💾 CSV",
-                        csv,
+                        partial(pipeline.csv_stage, cde_key, df_cde),
                         f"Data_{ts}.csv",
                         "text/csv",
+                        on_click="ignore",
                         use_container_width=True
                     )
     
@@ -565,9 +672,46 @@ if f_stock:
     show_tab("Faible", "⚠️ Faible")
     show_tab("OK", "✅ OK")
     show_tab("Tout", "📋 Tout")
+    
+    # --- TENDANCES ---
+    with tabs[tabs_list.index("📈 Tendances")]:
+        if not analytics.ARROW_AVAILABLE:
+            st.info("Tendances indisponibles : pyarrow requis")
+        else:
+            periode = st.radio("Période", list(TREND_PERIODS), horizontal=True, key="trend_period")
+            since = (datetime.now() - timedelta(days=TREND_PERIODS[periode])).strftime("%Y-%m-%d")
+            df_jours, df_ruptures = load_trends(since)
+            
+            if df_jours.empty:
+                st.info("Aucune analyse enregistrée sur la période")
+            else:
+                t1, t2, t3 = st.columns(3)
+                t1.metric("🗓️ Jours", len(df_jours))
+                t2.metric("🔁 Analyses", int(df_jours["Analyses"].sum()))
+                t3.metric("📈 Taux moyen", f"{df_jours['Servi'].sum() / max(df_jours['Demande'].sum(), 1) * 100:.1f}%")
+                
+                st.markdown("### 📈 Taux de service par jour")
+                st.line_chart(df_jours.set_index("date")["Taux"], y_label="Taux (%)")
+                
+                st.markdown("### ❌ Ruptures récurrentes")
+                if df_ruptures.empty:
+                    st.success("✅ Aucune rupture sur la période")
+                else:
+                    st.bar_chart(df_ruptures.head(20).set_index("Ref")["Ruptures"], y_label="Analyses en rupture")
+                    st.dataframe(
+                        df_ruptures.style.format({"Fréquence": "{:.0f}%", "Manquant": "{:.0f}"}),
+                        hide_index=True,
+                        use_container_width=True
+                    )
+                    
+                    ref = st.selectbox("Historique d'une réf.", df_ruptures["Ref"], key="trend_ref")
+                    df_ref = analytics.ref_by_day(ref, since)
+                    st.bar_chart(df_ref.set_index("date")[["Servi", "Manquant"]], color=["#38ef7d", "#f5576c"])
 
 else:
     st.info("👈 Chargez le fichier stock")
 
+metrics.record_duration("page", _T_START, st.session_state.username)
+
 if st.session_state.authenticated:
     st.markdown("""<div class="footer">Powered by IC | 2025 ⭐⭐⭐⭐⭐ </div>""", unsafe_allow_html=True)
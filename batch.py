@@ -0,0 +1,128 @@
+# Analyse stock / commandes sans interface (cron, traitement de nuit)
+# N'importe ni Streamlit ni Plotly : seulement le pipeline et ses modules.
+# Usage :
+#   python batch.py nuit/2025-06-01 nuit/2025-06-02 -o exports/   # un dossier = 1 stock .xlsx + ses PDF/zip
+#   python batch.py --stock stock.xlsx --pdf a.pdf b.zip            # une seule analyse
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from allocation import PRIORITIES, STRATEGIES, kpis
+from extraction import collect_pdfs
+import pipeline
+
+
+class Job:
+    def __init__(self, name, stock, pdfs, output_dir):
+        self.name = name
+        self.stock = Path(stock)
+        self.pdfs = [Path(p) for p in pdfs]
+        self.output_dir = Path(output_dir)
+
+
+def job_from_dir(directory, output_dir=None):
+    directory = Path(directory)
+    stocks = sorted(directory.glob("*.xlsx"))
+    if len(stocks) != 1:
+        raise ValueError(f"{directory} : 1 fichier stock .xlsx attendu, {len(stocks)} trouvé(s)")
+    pdfs = sorted(p for p in directory.iterdir() if p.suffix.lower() in (".pdf", ".zip"))
+    if not pdfs:
+        raise ValueError(f"{directory} : aucun PDF de commandes")
+    return Job(directory.name, stocks[0], pdfs, output_dir or directory)
+
+
+# --- Analyse d'un couple stock / commandes ---
+
+def run_job(job, priority="commande", strategy="fifo", workers=None):
+    start = time.perf_counter()
+    stock_key, df_stock = pipeline.stock_stage(job.stock)
+    orders_key, (df_cde, doublons) = pipeline.orders_stage(list(collect_pdfs(job.pdfs)), workers)
+    if df_cde.empty:
+        raise ValueError(f"{job.name} : aucune ligne de commande extraite")
+
+    allocation_key, lignes = pipeline.allocation_stage(stock_key, df_stock, orders_key, df_cde, priority, strategy)
+    df_ana = pipeline.aggregate_stage(allocation_key, lignes)
+
+    job.output_dir.mkdir(parents=True, exist_ok=True)
+    output = job.output_dir / f"GESTHOR_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    output.write_bytes(pipeline.export_stage(allocation_key, df_ana, lignes))
+
+    return {
+        "job": job.name,
+        "fichier": str(output),
+        "lignes": len(df_cde),
+        "doublons": len(doublons),
+        "durée_s": round(time.perf_counter() - start, 2),
+        **kpis(df_ana),
+    }
+
+
+def _run_job_safe(job, priority, strategy, workers):
+    try:
+        return run_job(job, priority, strategy, workers)
+    except Exception as e:
+        return {"job": job.name, "erreur": str(e)}
+
+
+def run_jobs(jobs, priority="commande", strategy="fifo", parallel=None):
+    # Analyses en parallèle ; les processus d'extraction se partagent les cœurs restants
+    parallel = max(1, min(parallel or os.cpu_count() or 1, len(jobs)))
+    if parallel == 1:
+        for job in jobs:
+            yield _run_job_safe(job, priority, strategy, None)
+        return
+
+    workers = max(1, (os.cpu_count() or 1) // parallel)
+    with ProcessPoolExecutor(parallel, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(_run_job_safe, job, priority, strategy, workers) for job in jobs]
+        for future in futures:
+            yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GESTHOR : analyse stock / commandes sans interface")
+    parser.add_argument("dirs", nargs="*", help="dossiers contenant 1 stock .xlsx et des PDF/zip de commandes")
+    parser.add_argument("--stock", help="fichier stock .xlsx (avec --pdf)")
+    parser.add_argument("--pdf", nargs="+", default=[], help="PDF, zip ou dossiers de commandes (avec --stock)")
+    parser.add_argument("-o", "--output", help="dossier de sortie (par défaut : dossier de chaque analyse)")
+    parser.add_argument("--priority", choices=list(PRIORITIES), default="commande")
+    parser.add_argument("--strategy", choices=list(STRATEGIES), default="fifo")
+    parser.add_argument("-j", "--jobs", type=int, help="analyses en parallèle (par défaut : nombre de cœurs)")
+    args = parser.parse_args(argv)
+
+    if bool(args.stock) != bool(args.pdf):
+        parser.error("--stock et --pdf vont ensemble")
+    if not args.stock and not args.dirs:
+        parser.error("indiquer des dossiers ou --stock / --pdf")
+
+    jobs, erreurs = [], 0
+    if args.stock:
+        jobs.append(Job(Path(args.stock).stem, args.stock, args.pdf, args.output or Path(args.stock).parent))
+    for directory in args.dirs:
+        # Plusieurs dossiers vers un même dossier de sortie : un sous-dossier par analyse
+        output_dir = Path(args.output) / Path(directory).name if args.output else None
+        try:
+            jobs.append(job_from_dir(directory, output_dir))
+        except (OSError, ValueError) as e:
+            print(f"❌ {e}", file=sys.stderr)
+            erreurs += 1
+
+    for result in run_jobs(jobs, args.priority, args.strategy, args.jobs):
+        if "erreur" in result:
+            print(f"❌ {result['job']} : {result['erreur']}", file=sys.stderr)
+            erreurs += 1
+        else:
+            print(
+                f"✅ {result['job']} : {result['Commandes']} cde, {result['lignes']} lignes, "
+                f"taux {result['Taux']:.1f}% ({result['durée_s']} s) -> {result['fichier']}"
+            )
+    return 1 if erreurs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
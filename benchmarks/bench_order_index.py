@@ -0,0 +1,63 @@
+# Attribution ligne -> commande : balayage linéaire (ancien code) vs index trié (CommandeIndex)
+# Usage : python benchmarks/bench_order_index.py
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from extraction import CMD_PATTERN, LINE_PATTERN, CommandeIndex
+
+LIGNES_PAR_COMMANDE = 10
+TAILLES = (10, 100, 500, 1000, 2000, 5000)
+
+
+def make_text(nb_commandes):
+    parts = []
+    for c in range(nb_commandes):
+        parts.append(f"Commande n° {4500000 + c}")
+        for l in range(LIGNES_PAR_COMMANDE):
+            ref = 10000 + (c * 7 + l) % 9000
+            parts.append(f"{l + 1} {ref} 3760000{ref:06d} 6 Produit {ref} {l + 3} 1 12,50")
+    return "\n".join(parts)
+
+
+def linear_lookup(text):
+    cmd_positions = {m.start(): m.group(1) for m in CMD_PATTERN.finditer(text)}
+    cmd_starts = sorted(cmd_positions.keys())
+    result = []
+    for match in LINE_PATTERN.finditer(text):
+        pos = match.start()
+        current_cmd = "INCONNU"
+        for start_pos in cmd_starts:
+            if start_pos <= pos:
+                current_cmd = cmd_positions[start_pos]
+            else:
+                break
+        result.append(current_cmd)
+    return result
+
+
+def indexed_lookup(text):
+    index = CommandeIndex(text)
+    return [index.lookup(m.start()) or "INCONNU" for m in LINE_PATTERN.finditer(text)]
+
+
+def timed(fn, text):
+    start = time.perf_counter()
+    result = fn(text)
+    return time.perf_counter() - start, result
+
+
+def main(sizes=TAILLES):
+    print(f"{'commandes':>10} {'lignes':>8} {'linéaire (s)':>14} {'index (s)':>10} {'gain':>7}")
+    for nb in sizes:
+        text = make_text(nb)
+        t_lin, r_lin = timed(linear_lookup, text)
+        t_idx, r_idx = timed(indexed_lookup, text)
+        assert r_lin == r_idx
+        print(f"{nb:>10} {len(r_idx):>8} {t_lin:>14.4f} {t_idx:>10.4f} {t_lin / t_idx:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or TAILLES)
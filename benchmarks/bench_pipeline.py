@@ -0,0 +1,177 @@
+# Banc de mesure du pipeline complet sur données synthétiques (stock .xlsx + PDF de commandes)
+# Par étape et par taille : temps, débit (lignes/s) et pic mémoire, comparés à une référence stockée.
+# Usage :
+#   python benchmarks/bench_pipeline.py                       # toutes les tailles de TAILLES
+#   python benchmarks/bench_pipeline.py 1000 10000            # tailles choisies
+#   python benchmarks/bench_pipeline.py --save-baseline 1000  # enregistre la référence
+#   python benchmarks/bench_pipeline.py --colonnes 50 10000   # stock large (export ERP complet)
+# Chaque étape tourne dans un processus neuf : le pic mémoire mesuré est celui de l'étape seule.
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+TAILLES = (1_000, 10_000, 100_000, 1_000_000)
+ETAPES = ("stock", "extraction", "allocation", "export")
+DATA_DIR = Path(__file__).resolve().parent / ".data"
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+# Écart de temps toléré par rapport à la référence avant de signaler une régression
+TOLERANCE = 0.25
+# En dessous de cet écart absolu, la différence est du bruit de mesure
+ECART_MIN_S = 0.1
+SEED = 0
+
+
+def nb_articles(taille):
+    return max(1_000, taille // 2)
+
+
+def _peak_mb():
+    # ru_maxrss en Ko sous Linux ; les processus fils comptent (pool d'extraction)
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(self_kb, children_kb) / 1024
+
+
+# --- Données ---
+
+def prepare(taille, colonnes=0):
+    from synthetic import make_orders_pdf, make_stock_xlsx
+
+    DATA_DIR.mkdir(exist_ok=True)
+    stock_path = DATA_DIR / f"stock-{taille}-{SEED}{f'-{colonnes}c' if colonnes else ''}.xlsx"
+    pdf_path = DATA_DIR / f"commandes-{taille}-{SEED}.pdf"
+    if not stock_path.exists():
+        print(f"  génération {stock_path.name}…", flush=True)
+        make_stock_xlsx(stock_path, nb_articles(taille), seed=SEED, extra_columns=colonnes)
+    if not pdf_path.exists():
+        print(f"  génération {pdf_path.name}…", flush=True)
+        make_orders_pdf(pdf_path, taille, nb_articles(taille), seed=SEED)
+    return stock_path, pdf_path
+
+
+# --- Étapes (exécutées dans le processus fils) ---
+# Les entrées viennent de l'étape précédente via des snapshots Feather dans DATA_DIR
+
+def run_stage(stage, taille, colonnes=0):
+    import pandas as pd
+
+    stock_path, pdf_path = prepare(taille, colonnes)
+    work = DATA_DIR / f"run-{taille}"
+    work.mkdir(exist_ok=True)
+
+    if stage == "stock":
+        from stock import normalize_stock, read_stock_columns
+        inputs, compute = (), lambda: normalize_stock(read_stock_columns(stock_path))
+    elif stage == "extraction":
+        from extraction import extract_orders
+        inputs, compute = (), lambda: extract_orders(str(pdf_path))
+    elif stage == "allocation":
+        from allocation import allocate
+        inputs = (pd.read_feather(work / "commandes.feather"), pd.read_feather(work / "stock.feather"))
+        compute = lambda: allocate(*inputs)
+    elif stage == "export":
+        from export import build_workbook
+        inputs = (pd.read_feather(work / "analyse.feather"), pd.read_feather(work / "lignes.feather"))
+        compute = lambda: build_workbook(*inputs)
+    else:
+        raise ValueError(f"Étape inconnue : {stage}")
+
+    before = _peak_mb()
+    start = time.perf_counter()
+    result = compute()
+    wall = time.perf_counter() - start
+    peak = max(_peak_mb() - before, 0.0)
+
+    if stage == "stock":
+        result.to_feather(work / "stock.feather")
+    elif stage == "extraction":
+        result.to_feather(work / "commandes.feather")
+    elif stage == "allocation":
+        result[0].to_feather(work / "lignes.feather")
+        result[1].to_feather(work / "analyse.feather")
+
+    return {"wall_s": round(wall, 4), "peak_mb": round(peak, 1), "lignes_s": round(taille / wall, 1)}
+
+
+def measure(stage, taille, colonnes=0):
+    out = subprocess.run(
+        [sys.executable, __file__, "--stage", stage, str(taille), "--colonnes", str(colonnes)],
+        capture_output=True, text=True, cwd=ROOT,
+    )
+    if out.returncode != 0:
+        raise RuntimeError(f"{stage} ({taille}) : {out.stderr.strip()}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+# --- Comparaison à la référence ---
+
+def load_baseline():
+    if not BASELINE.exists():
+        return {}
+    with open(BASELINE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(sizes, save_baseline=False, tolerance=TOLERANCE, colonnes=0):
+    # Stock large : mesuré et comparé sous sa propre clé ("10000+50c")
+    baseline = load_baseline()
+    results = {}
+    regressions = []
+
+    print(f"{'lignes':>9} {'étape':<11} {'temps (s)':>10} {'lignes/s':>11} {'pic (Mo)':>9} {'réf. (s)':>9} {'écart':>8}")
+    for taille in sizes:
+        prepare(taille, colonnes)
+        cle = f"{taille}+{colonnes}c" if colonnes else str(taille)
+        results[cle] = {}
+        for stage in ETAPES:
+            mesure = measure(stage, taille, colonnes)
+            results[cle][stage] = mesure
+
+            ref = baseline.get(cle, {}).get(stage)
+            ecart = ""
+            if ref:
+                ratio = mesure["wall_s"] / ref["wall_s"] - 1
+                ecart = f"{ratio:+.0%}"
+                if ratio > tolerance and mesure["wall_s"] - ref["wall_s"] > ECART_MIN_S:
+                    ecart += " !"
+                    regressions.append(f"{stage} ({taille} lignes) : {ref['wall_s']} s -> {mesure['wall_s']} s")
+            print(
+                f"{taille:>9} {stage:<11} {mesure['wall_s']:>10.3f} {mesure['lignes_s']:>11.0f} "
+                f"{mesure['peak_mb']:>9.1f} {ref['wall_s'] if ref else '-':>9} {ecart:>8}",
+                flush=True,
+            )
+
+    if save_baseline:
+        baseline.update(results)
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Référence enregistrée : {BASELINE}")
+
+    if regressions:
+        print(f"\nRégressions (> {tolerance:.0%}) :")
+        for r in regressions:
+            print(f"  - {r}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sizes", nargs="*", type=int)
+    parser.add_argument("--stage", choices=ETAPES)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--colonnes", type=int, default=0, help="colonnes inutilisées en plus dans le stock")
+    args = parser.parse_args()
+
+    if args.stage:
+        print(json.dumps(run_stage(args.stage, args.sizes[0], args.colonnes)))
+    else:
+        sys.exit(main(args.sizes or TAILLES, args.save_baseline, args.tolerance, args.colonnes))
@@ -0,0 +1,42 @@
+# Démarrage de l'application : page de connexion à froid (processus neuf) puis rerun d'une session non connectée
+# Indique aussi quels modules lourds ont été importés pour afficher la page.
+# Usage : python benchmarks/bench_startup.py [nb_essais]
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+ESSAIS = 5
+MODULES_LOURDS = ("pandas", "numpy", "pdfplumber", "openpyxl", "pyarrow", "plotly")
+
+_CHILD = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=60)
+t = time.perf_counter(); at.run(); froid = time.perf_counter() - t
+t = time.perf_counter(); at.run(); rerun = time.perf_counter() - t
+assert not at.exception, at.exception
+print(json.dumps({"froid": froid, "rerun": rerun, "modules": [m for m in %r if m in sys.modules]}))
+""" % (MODULES_LOURDS,)
+
+
+def run_once():
+    out = subprocess.run([sys.executable, "-c", _CHILD], capture_output=True, text=True, cwd=ROOT)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip())
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(essais=ESSAIS):
+    runs = [run_once() for _ in range(essais)]
+    froid = statistics.median(r["froid"] for r in runs)
+    rerun = statistics.median(r["rerun"] for r in runs)
+    print(f"page de connexion, à froid : {froid * 1000:8.1f} ms (médiane sur {essais})")
+    print(f"rerun non connecté         : {rerun * 1000:8.1f} ms")
+    print(f"modules lourds importés    : {', '.join(runs[-1]['modules']) or 'aucun'}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ESSAIS)
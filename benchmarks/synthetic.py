@@ -0,0 +1,108 @@
+# Générateurs de fichiers synthétiques au format attendu par GESTHOR :
+# - classeur stock (.xlsx) avec les colonnes de l'export ERP
+# - PDF de commandes : "Commande n° ..." puis des lignes au format de LINE_PATTERN
+# Le PDF est écrit à la main (Helvetica, WinAnsi) pour ne dépendre d'aucune bibliothèque.
+import random
+from pathlib import Path
+
+from openpyxl import Workbook
+
+STOCK_HEADER = [
+    "N° article.", "Description", "Inventory", "Qty. per Sales Unit of Measure",
+    "Unit of Measure", "Vendor No.", "Unit Cost",
+]
+PREMIER_ARTICLE = 100000
+LIGNES_PAR_PAGE = 60
+
+
+def article_codes(nb_articles):
+    return [str(PREMIER_ARTICLE + i) for i in range(nb_articles)]
+
+
+def make_stock_xlsx(path, nb_articles, seed=0, extra_columns=0):
+    # extra_columns : colonnes inutilisées en plus, comme dans un export ERP complet
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Stock")
+    ws.append(STOCK_HEADER + [f"Champ {i}" for i in range(extra_columns)])
+    for code in article_codes(nb_articles):
+        ws.append([
+            code, f"Produit synthétique {code}", rng.choice([0, rng.randint(1, 499), rng.randint(500, 5000)]),
+            rng.choice([1, 6, 12, 24]), "PCS", f"F{rng.randint(100, 999)}", round(rng.uniform(0.5, 50), 2),
+        ] + [rng.randint(0, 999) if i % 2 else f"V{i}-{rng.randint(0, 99)}" for i in range(extra_columns)])
+    wb.save(path)
+    return Path(path)
+
+
+def order_lines(nb_lines, nb_articles, lignes_par_commande=25, seed=0):
+    rng = random.Random(seed)
+    codes = article_codes(nb_articles)
+    numero = 4500000
+    for i in range(nb_lines):
+        if i % lignes_par_commande == 0:
+            numero += 1
+            yield f"Commande n° {numero}"
+            yield "Ligne Article EAN UC Désignation Qté Colis Prix"
+            # Réf. distinctes dans une commande : le parseur écarte les lignes en double
+            refs = rng.sample(codes, min(lignes_par_commande, len(codes)))
+        code = refs[i % lignes_par_commande % len(refs)]
+        yield (
+            f"{i % lignes_par_commande + 1} {code} 376{int(code):010d} {rng.randint(1, 12)} "
+            f"Produit synthétique {code} {rng.randint(1, 60)} {rng.randint(1, 9)} {rng.randint(1, 99)},{rng.randint(10, 99)}"
+        )
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode("cp1252")
+
+
+def write_pdf(path, lines):
+    # Une page par tranche de LIGNES_PAR_PAGE lignes ; objets écrits au fil de l'eau
+    path = Path(path)
+    offsets = []
+    page_ids = []
+
+    with open(path, "wb") as f:
+        def obj(num, body):
+            while len(offsets) < num:
+                offsets.append(None)
+            offsets[num - 1] = f.tell()
+            f.write(f"{num} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        obj(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+        next_id = 4
+        page = []
+        lines = iter(lines)
+        while True:
+            line = next(lines, None)
+            if line is not None:
+                page.append(line)
+            if page and (line is None or len(page) == LIGNES_PAR_PAGE):
+                stream = b"BT /F1 8 Tf 30 810 Td 11 TL\n" + b"".join(b"(" + _escape(t) + b") Tj T*\n" for t in page) + b"ET"
+                obj(next_id, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+                obj(next_id + 1, (
+                    b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                    b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % next_id
+                ))
+                page_ids.append(next_id + 1)
+                next_id += 2
+                page = []
+            if line is None:
+                break
+
+        kids = b" ".join(b"%d 0 R" % i for i in page_ids)
+        obj(2, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids))
+        obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, xref))
+    return path
+
+
+def make_orders_pdf(path, nb_lines, nb_articles, seed=0):
+    return write_pdf(path, order_lines(nb_lines, nb_articles, seed=seed))
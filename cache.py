@@ -0,0 +1,138 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+# --- Vérification PyArrow (Parquet / Feather) ---
+try:
+    import pyarrow.feather as feather
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+CACHE_DIR = Path(os.environ.get("GESTHOR_CACHE_DIR", ".gesthor_cache"))
+
+
+def _digest(f):
+    h = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1 << 20), b""):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def file_hash(file):
+    # Empreinte du contenu : même fichier re-uploadé = même clé, quel que soit son nom
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            return _digest(f)
+    file.seek(0)
+    digest = _digest(file)
+    file.seek(0)
+    return digest
+
+
+class FrameCache:
+    # Cache de DataFrames : LRU en mémoire, adossé à des fichiers Parquet ou Feather sur disque.
+    # Feather (Arrow IPC non compressé) est relu par memory-map : colonnes numériques sans copie,
+    # seules les colonnes texte / catégorielles sont converties.
+    # Les DataFrames renvoyés sont partagés : à traiter en lecture seule.
+    # max_entries=0 : disque seul, quand un autre cache (pipeline.STAGES) garde déjà les frames en mémoire.
+    # Sur disque aussi, les fichiers les moins récemment lus sont supprimés au-delà de max_files / max_disk_mb.
+
+    def __init__(self, name, max_entries=32, directory=CACHE_DIR, fmt="parquet", max_files=64, max_disk_mb=512):
+        self.max_entries = max_entries
+        self.max_files = max_files
+        self.max_disk_bytes = max_disk_mb << 20
+        self.directory = Path(directory) / name
+        self.fmt = fmt
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return self.directory / f"{key}.{self.fmt}"
+
+    def _read(self, path):
+        if self.fmt == "feather":
+            # Un bloc par colonne : les colonnes numériques restent adossées au memory-map, sans copie
+            return feather.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+        return pd.read_parquet(path)
+
+    def _write(self, df, path):
+        if self.fmt == "feather":
+            feather.write_feather(df.reset_index(drop=True), path, compression="uncompressed")
+        else:
+            df.to_parquet(path, index=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        if not ARROW_AVAILABLE:
+            return None
+        path = self._path(key)
+        try:
+            df = self._read(path)
+            # Date de modification = dernier accès : ordre d'éviction du disque
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        self._remember(key, df)
+        return df
+
+    def put(self, key, df):
+        self._remember(key, df)
+        if not ARROW_AVAILABLE:
+            return
+        path = self._path(key)
+        # Écriture atomique : un lecteur concurrent ne voit jamais de fichier partiel
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._write(df, tmp)
+            os.replace(tmp, path)
+        except (OSError, ValueError, TypeError):
+            # Colonnes non sérialisables en Arrow : on garde seulement le cache mémoire
+            tmp.unlink(missing_ok=True)
+            return
+        self._prune_disk(keep=path)
+
+    def _prune_disk(self, keep=None):
+        # Les plus anciens d'abord ; le fichier tout juste écrit reste
+        files = []
+        for path in self.directory.glob(f"*.{self.fmt}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        count, total = len(files), sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if count <= self.max_files and total <= self.max_disk_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            count, total = count - 1, total - size
+
+    def _remember(self, key, df):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = df
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.directory.exists():
+            for path in self.directory.glob(f"*.{self.fmt}"):
+                path.unlink(missing_ok=True)
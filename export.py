@@ -0,0 +1,46 @@
+import io
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+HEADER_FONT = Font(bold=True)
+
+
+def _write_sheet(wb, title, df):
+    # Mode write_only : les lignes partent directement dans le fichier, mémoire constante
+    ws = wb.create_sheet(title)
+    header = []
+    for column in df.columns:
+        cell = WriteOnlyCell(ws, value=column)
+        cell.font = HEADER_FONT
+        header.append(cell)
+    ws.append(header)
+    for row in df.itertuples(index=False, name=None):
+        ws.append(row)
+
+
+def build_workbook(df_ana, lignes):
+    all_livres = lignes[lignes["Manquant"] == 0]
+    all_ruptures = lignes[lignes["Manquant"] > 0]
+
+    df_recap = df_ana[["Commande", "Taux", "Demande", "Servi"]].copy()
+    df_recap["Manquant"] = df_recap["Demande"] - df_recap["Servi"]
+
+    wb = Workbook(write_only=True)
+    _write_sheet(wb, "Recap", df_recap)
+
+    if not all_livres.empty:
+        _write_sheet(wb, "Livres", all_livres)
+
+    if not all_ruptures.empty:
+        _write_sheet(wb, "Ruptures", all_ruptures)
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def build_csv(df_cde):
+    return df_cde.to_csv(index=False).encode('utf-8')
@@ -0,0 +1,403 @@
+import io
+import os
+import re
+import zipfile
+import tempfile
+import threading
+import multiprocessing
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import pdfplumber
+
+from cache import FrameCache, file_hash
+
+# --- Vérification pypdfium2 (texte rapide, installé avec pdfplumber) ---
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+
+# --- Motifs ---
+CMD_PATTERN = re.compile(r"Commande\s+n[°º]?\s*(\d{5,10})", re.IGNORECASE)
+
+LINE_PATTERN = re.compile(
+    r'^\s*(\d{1,3})\s+(\d{3,7})\s+(\d{13})\s+(\d{1,4})\s+(.+?)\s+(\d{1,5})\s+(\d{1,4})\s+(?:EUR|\d+[,\.]\d+)',
+    re.MULTILINE
+)
+
+ALT_PATTERN = re.compile(
+    r'^\s*\d{1,3}\s+(\d{3,7})\s+\d{13}\s+.{10,200}?\s(\d{1,5})\s+\d{1,4}\s+(?:EUR|\d+[,\.]\d+)',
+    re.MULTILINE | re.DOTALL
+)
+
+# Contrôles du texte rapide : chaque ligne de commande porte un EAN-13, chaque en-tête "Commande n"
+EAN_PATTERN = re.compile(r"(?<!\d)\d{13}(?!\d)")
+CMD_HINT_PATTERN = re.compile(r"Commande\s+n", re.IGNORECASE)
+
+# En dessous de ce nombre de lignes, on tente le motif alternatif
+MIN_LIGNES = 5
+COLUMNS = ["Commande", "Ref", "Qte_Cde"]
+# Numéros de commande et références très répétés : catégories ; quantités sur 5 chiffres max
+DTYPES = {"Commande": "category", "Ref": "category", "Qte_Cde": "int32"}
+# À incrémenter dès que le résultat du parsing change : invalide le cache disque
+PARSER_VERSION = 2
+
+# Disque seul : en mémoire, les commandes ne sont gardées que par pipeline.STAGES
+ORDERS_CACHE = FrameCache("commandes", max_entries=0)
+# Texte brut pdfium vérifié page par page, mise en page pdfplumber en secours (GESTHOR_FAST_TEXT=0 pour désactiver)
+FAST_TEXT = PDFIUM_AVAILABLE and os.environ.get("GESTHOR_FAST_TEXT", "1") != "0"
+# En dessous de ce nombre de pages, le pool de processus coûte plus qu'il ne rapporte
+# (texte rapide : une centaine de pages par seconde et par cœur)
+SEUIL_PARALLELE = 400 if FAST_TEXT else 24
+# Taille minimale d'un lot : chaque lot vérifie une page avec pdfplumber
+PAGES_PAR_LOT_MIN = 50 if FAST_TEXT else 1
+# PDFium n'est pas thread-safe : une page à la fois par processus (sessions Streamlit concurrentes)
+_PDFIUM_LOCK = threading.Lock()
+
+_POOL = None
+_POOL_WORKERS = 0
+# Plusieurs analyses en arrière-plan (jobs.py) peuvent demander le pool en même temps
+_POOL_LOCK = threading.Lock()
+
+
+# --- Analyse d'une page ---
+
+class CommandeIndex:
+    # Positions triées des "Commande n°" d'un texte : ligne -> commande par recherche binaire
+    def __init__(self, text):
+        self.starts = []
+        self.numbers = []
+        for match in CMD_PATTERN.finditer(text):
+            self.starts.append(match.start())
+            self.numbers.append(match.group(1))
+
+    def lookup(self, pos):
+        # None = ligne avant la première commande de la page (reprise de la page précédente)
+        i = bisect_right(self.starts, pos)
+        return self.numbers[i - 1] if i else None
+
+    @property
+    def last(self):
+        return self.numbers[-1] if self.numbers else None
+
+
+def _match_rows(pattern, text, index, ref_group, qty_group):
+    rows = []
+    for match in pattern.finditer(text):
+        try:
+            ref = match.group(ref_group).strip()
+            qty = int(match.group(qty_group).strip())
+            rows.append((index.lookup(match.start()), ref, qty))
+        except:
+            continue
+    return rows
+
+
+def parse_page(text):
+    index = CommandeIndex(text)
+
+    rows = _match_rows(LINE_PATTERN, text, index, 2, 6)
+    # Le motif alternatif ne sert que si tout le document a moins de MIN_LIGNES lignes,
+    # ce qui implique que chaque page en a moins : inutile de le tenter ailleurs
+    alt_rows = []
+    if len(rows) < MIN_LIGNES:
+        alt_rows = _match_rows(ALT_PATTERN, text, index, 1, 2)
+
+    return rows, alt_rows, index.last
+
+
+def _fast_page_ok(text, result):
+    # Autant de lignes reconnues que d'EAN, autant de commandes que d'en-têtes : sinon,
+    # l'ordre ou l'espacement du texte brut diffère de la mise en page et la page est relue
+    rows, _, _ = result
+    nb_cmd = len(CMD_PATTERN.findall(text))
+    return len(rows) == len(EAN_PATTERN.findall(text)) and nb_cmd == len(CMD_HINT_PATTERN.findall(text))
+
+
+class PageReader:
+    # Pages d'un PDF -> parse_page(), par le texte rapide quand il est fiable.
+    # La 1re page contenant des lignes est aussi lue par pdfplumber : si les résultats diffèrent,
+    # le reste des pages lues par ce lecteur repasse par pdfplumber.
+
+    def __init__(self, source, fast=None):
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+            source = source.read()
+        self.source = source
+        self.fast = FAST_TEXT if fast is None else fast and PDFIUM_AVAILABLE
+        self.calibrated = False
+        self.fallbacks = 0
+        self._nb_pages = None
+        self._pdfium = None
+        self._plumber = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        # Nombre de pages lu une fois ; côté PDFium sous verrou, comme tout appel à la bibliothèque
+        if self._nb_pages is None:
+            if self.fast:
+                doc = self._pdfium_doc()
+                with _PDFIUM_LOCK:
+                    self._nb_pages = len(doc)
+            else:
+                self._nb_pages = len(self._plumber_doc().pages)
+        return self._nb_pages
+
+    def _pdfium_doc(self):
+        if self._pdfium is None:
+            with _PDFIUM_LOCK:
+                self._pdfium = pdfium.PdfDocument(self.source)
+        return self._pdfium
+
+    def _plumber_doc(self):
+        if self._plumber is None:
+            source = io.BytesIO(self.source) if isinstance(self.source, bytes) else self.source
+            self._plumber = pdfplumber.open(source)
+        return self._plumber
+
+    def fast_text(self, i):
+        doc = self._pdfium_doc()
+        with _PDFIUM_LOCK:
+            page = doc[i]
+            textpage = page.get_textpage()
+            text = textpage.get_text_range()
+            textpage.close()
+            page.close()
+        return text.replace("\r\n", "\n")
+
+    def full_text(self, i):
+        page = self._plumber_doc().pages[i]
+        text = page.extract_text() or ""
+        # Libère le cache de mise en page : mémoire stable quelle que soit la taille du PDF
+        page.close()
+        return text
+
+    def parse(self, i):
+        if self.fast:
+            text = self.fast_text(i)
+            result = parse_page(text)
+            if _fast_page_ok(text, result):
+                if self.calibrated or not result[0]:
+                    return result
+                full = parse_page(self.full_text(i))
+                if full == result:
+                    self.calibrated = True
+                    return result
+                self.fast = False
+                return full
+        self.fallbacks += 1
+        return parse_page(self.full_text(i))
+
+    def close(self):
+        if self._pdfium is not None:
+            with _PDFIUM_LOCK:
+                self._pdfium.close()
+            self._pdfium = None
+        if self._plumber is not None:
+            self._plumber.close()
+            self._plumber = None
+
+
+def _parse_pages(path, first, last):
+    with PageReader(path) as reader:
+        return [reader.parse(i) for i in range(first, last)]
+
+
+def _iter_pages(reader, progress=None):
+    for i in range(len(reader)):
+        yield reader.parse(i)
+        if progress is not None:
+            progress.add(1)
+
+
+class PageProgress:
+    # Pages traitées, tous fichiers confondus -> callback(faites, total).
+    # Appelé depuis les threads du pool pour les lots parallèles, d'où le verrou.
+
+    def __init__(self, callback, total):
+        self.callback = callback
+        self.total = total
+        self.done = 0
+        self._lock = threading.Lock()
+
+    def add(self, n):
+        with self._lock:
+            self.done += n
+            done = self.done
+        self.callback(done, self.total)
+
+    def track(self, future):
+        def done(f):
+            if f.exception() is None:
+                self.add(len(f.result()))
+        future.add_done_callback(done)
+        return future
+
+
+# --- Pool de processus ---
+
+def _get_pool(workers):
+    # À appeler sous _POOL_LOCK, soumission des lots comprise : un autre thread ne peut pas
+    # remplacer le pool entre les deux. Recréé seulement pour grandir ; les lots déjà soumis
+    # à l'ancien pool s'y terminent (shutdown sans annulation).
+    global _POOL, _POOL_WORKERS
+    if _POOL is None or _POOL_WORKERS < workers:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False)
+        # spawn : le serveur Streamlit est multi-thread, fork n'y est pas sûr
+        _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _POOL_WORKERS = workers
+    return _POOL
+
+
+def _submit_pages(pool, path, nb_pages, workers):
+    # Plusieurs lots par worker pour lisser les pages plus lourdes que d'autres
+    size = max(PAGES_PAR_LOT_MIN, -(-nb_pages // (workers * 4)))
+    return [pool.submit(_parse_pages, path, first, min(first + size, nb_pages)) for first in range(0, nb_pages, size)]
+
+
+def _collect(futures):
+    for future in futures:
+        yield from future.result()
+
+
+# --- Assemblage ---
+
+def _assemble(page_results):
+    orders, alt_orders = [], []
+    current_cmd = "INCONNU"
+    found_cmd = False
+
+    for rows, alt_rows, last_cmd in page_results:
+        for target, page_rows in ((orders, rows), (alt_orders, alt_rows)):
+            for cmd, ref, qty in page_rows:
+                target.append((cmd or current_cmd, ref, qty))
+        if last_cmd is not None:
+            current_cmd = last_cmd
+            found_cmd = True
+
+    if not found_cmd:
+        return pd.DataFrame()
+
+    if len(orders) < MIN_LIGNES:
+        orders.extend(alt_orders)
+
+    if orders:
+        return pd.DataFrame(orders, columns=COLUMNS).drop_duplicates().astype(DTYPES)
+    return pd.DataFrame()
+
+
+def _as_path(pdf_file):
+    if isinstance(pdf_file, (str, os.PathLike)):
+        return os.fspath(pdf_file), False
+    # Fichier uploadé : les workers ont besoin d'un chemin pour rouvrir le PDF
+    pdf_file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(pdf_file.read())
+    pdf_file.seek(0)
+    return tmp.name, True
+
+
+def extract_orders_many(pdf_files, workers=None, progress=None):
+    # progress : callback(pages faites, pages au total), facultatif
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    readers = [PageReader(pdf_file) for pdf_file in pdf_files]
+    try:
+        nb_pages = [len(reader) for reader in readers]
+        if progress is not None:
+            progress = PageProgress(progress, sum(nb_pages))
+        if workers <= 1 or sum(nb_pages) < SEUIL_PARALLELE:
+            return [_assemble(_iter_pages(reader, progress)) for reader in readers]
+    finally:
+        for reader in readers:
+            reader.close()
+
+    workers = min(workers, sum(nb_pages))
+    paths = [_as_path(pdf_file) for pdf_file in pdf_files]
+    try:
+        # Les lots de tous les fichiers partent ensemble : durée proche de celle du plus gros fichier
+        with _POOL_LOCK:
+            pool = _get_pool(workers)
+            futures = [_submit_pages(pool, path, n, workers) for (path, _), n in zip(paths, nb_pages)]
+        if progress is not None:
+            futures = [[progress.track(f) for f in file_futures] for file_futures in futures]
+        return [_assemble(_collect(file_futures)) for file_futures in futures]
+    finally:
+        for path, is_tmp in paths:
+            if is_tmp:
+                os.remove(path)
+
+
+def extract_orders(pdf_file, workers=None):
+    return extract_orders_many([pdf_file], workers)[0]
+
+
+def orders_key(pdf_file):
+    return f"v{PARSER_VERSION}-{file_hash(pdf_file)}"
+
+
+def extract_orders_cached(pdf_file, workers=None, key=None):
+    return extract_orders_cached_many([pdf_file], workers, [key or orders_key(pdf_file)])[0]
+
+
+def extract_orders_cached_many(pdf_files, workers=None, keys=None, progress=None):
+    keys = keys or [orders_key(pdf_file) for pdf_file in pdf_files]
+    frames = [ORDERS_CACHE.get(key) for key in keys]
+
+    missing = [i for i, df in enumerate(frames) if df is None]
+    if missing:
+        parsed = extract_orders_many([pdf_files[i] for i in missing], workers, progress)
+        for i, df in zip(missing, parsed):
+            ORDERS_CACHE.put(keys[i], df)
+            frames[i] = df
+    return frames
+
+
+# --- Plusieurs fichiers ---
+
+def collect_pdfs(sources):
+    # Fichiers PDF, archives zip et dossiers, dans l'ordre d'arrivée
+    for source in sources:
+        if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+            yield from sorted(Path(source).glob("*.pdf"))
+            continue
+
+        name = os.fspath(source) if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+        if not name.lower().endswith(".zip"):
+            yield source
+            continue
+
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if info.filename.lower().endswith(".pdf"):
+                    member = io.BytesIO(archive.read(info))
+                    member.name = info.filename
+                    yield member
+
+
+def combine_orders(frames):
+    # Une commande présente dans plusieurs fichiers n'est gardée que dans le premier arrivé
+    parts, seen, doublons = [], set(), []
+    for df in frames:
+        if df.empty:
+            continue
+        commandes = df["Commande"].astype(str)
+        dup = (commandes.isin(seen) & (commandes != "INCONNU")).to_numpy()
+        doublons.extend(sorted(set(commandes[dup])))
+        parts.append(df[~dup].astype({"Commande": str, "Ref": str}))
+        seen.update(commandes.unique())
+
+    if not parts:
+        return pd.DataFrame(), doublons
+    return pd.concat(parts, ignore_index=True).astype(DTYPES), doublons
@@ -0,0 +1,128 @@
+import json
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+HISTORY_DB = "gesthor_history.db"
+# Ancien format (réécrit en entier à chaque analyse) : importé une fois à la création de la base
+LEGACY_HISTORY_FILE = "gesthor_history.json"
+
+FIELDS = ["nb_commandes", "taux_global", "total_demande", "total_servi"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    user TEXT,
+    nb_commandes INTEGER,
+    taux_global REAL,
+    total_demande INTEGER,
+    total_servi INTEGER,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history (timestamp);
+CREATE INDEX IF NOT EXISTS idx_history_user_timestamp ON history (user, timestamp);
+"""
+
+_initialized = set()
+
+
+def _connect(path):
+    # WAL : les lecteurs ne bloquent pas l'écrivain, et les écrivains concurrents
+    # attendent le verrou (timeout) au lieu de s'écraser mutuellement
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if path not in _initialized:
+        conn.executescript(_SCHEMA)
+        _import_legacy(conn)
+        _initialized.add(path)
+    return conn
+
+
+def _import_legacy(conn):
+    legacy = Path(LEGACY_HISTORY_FILE)
+    if not legacy.exists():
+        return
+    try:
+        with open(legacy, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return
+    # BEGIN IMMEDIATE : un seul processus importe, les autres voient la base déjà remplie
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM history LIMIT 1").fetchone() is None:
+            for entry in entries:
+                _insert(conn, entry)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    try:
+        legacy.rename(legacy.with_suffix(".json.imported"))
+    except OSError:
+        pass
+
+
+def _insert(conn, entry):
+    entry = dict(entry)
+    values = [entry.pop("timestamp"), entry.pop("user", None)] + [entry.pop(f, None) for f in FIELDS]
+    extra = json.dumps(entry, ensure_ascii=False) if entry else None
+    conn.execute(
+        "INSERT INTO history (timestamp, user, nb_commandes, taux_global, total_demande, total_servi, extra)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        values + [extra],
+    )
+
+
+def _to_dict(row):
+    entry = {k: row[k] for k in ["timestamp", "user"] + FIELDS if row[k] is not None}
+    if row["extra"]:
+        entry.update(json.loads(row["extra"]))
+    return entry
+
+
+def add_entry(analysis_data, user, path=HISTORY_DB):
+    entry = dict(analysis_data)
+    entry['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    entry['user'] = user
+    with closing(_connect(path)) as conn, conn:
+        _insert(conn, entry)
+    return entry
+
+
+def query(user=None, since=None, until=None, limit=None, path=HISTORY_DB):
+    # Entrées les plus récentes d'abord ; since / until au format "%Y-%m-%d %H:%M:%S" (ou préfixe)
+    clauses, params = [], []
+    if user is not None:
+        clauses.append("user = ?")
+        params.append(user)
+    if since is not None:
+        clauses.append("timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("timestamp <= ?")
+        params.append(until)
+
+    sql = "SELECT * FROM history"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY timestamp DESC, id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    with closing(_connect(path)) as conn:
+        return [_to_dict(row) for row in conn.execute(sql, params)]
+
+
+def purge(before=None, path=HISTORY_DB):
+    # Rétention : suppression par plage de dates (index), sans réécrire le reste
+    with closing(_connect(path)) as conn, conn:
+        if before is None:
+            conn.execute("DELETE FROM history")
+        else:
+            conn.execute("DELETE FROM history WHERE timestamp < ?", (before,))
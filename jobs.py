@@ -0,0 +1,184 @@
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import live
+import metrics
+import pipeline
+
+# Analyses exécutées hors du thread du script Streamlit : un rerun (clic, tri, filtre…)
+# lit l'avancement ou le résultat d'une tâche au lieu de relancer le calcul.
+# Threads plutôt que processus : les résultats vont dans le cache d'étapes partagé
+# (pipeline.STAGES) ; l'extraction des gros PDF a de toute façon son propre pool de processus.
+JOB_WORKERS = int(os.environ.get("GESTHOR_JOB_WORKERS", "2"))
+# Tâches terminées gardées pour les reruns. Elles ne gardent que des clés : les frames
+# restent dans pipeline.STAGES, seul cache soumis au budget mémoire.
+JOBS_KEPT = 16
+
+
+class Job:
+    # Une analyse en arrière-plan : étape courante, avancement dans l'étape, résultat ou erreur
+
+    def __init__(self, key, stages):
+        self.key = key
+        self.stages = stages
+        self.progress = (None, 0, 0)  # (étape, faits, total) : un seul tuple, lu sans verrou
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+
+    def report(self, stage, done=0, total=0):
+        self.progress = (stage, done, total)
+
+    @property
+    def running(self):
+        return self.finished is None
+
+    @property
+    def fraction(self):
+        # Avancement global : étapes terminées + part faite de l'étape courante
+        stage, done, total = self.progress
+        if not self.running:
+            return 1.0
+        if stage not in self.stages:
+            return 0.0
+        part = done / total if total else 0.0
+        return (self.stages.index(stage) + part) / len(self.stages)
+
+
+class JobQueue:
+
+    def __init__(self, workers=JOB_WORKERS, kept=JOBS_KEPT):
+        self.kept = kept
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="gesthor-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, key, stages, fn, *args):
+        # fn(job, *args) ; une tâche de même clé (en cours ou terminée) est réutilisée, pas relancée
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                self._jobs.move_to_end(key)
+                return job
+            job = self._jobs[key] = Job(key, stages)
+            self._prune()
+        self._pool.submit(self._run, job, fn, args)
+        return job
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def discard(self, key):
+        # Oublie une tâche terminée (ex. en erreur) : la prochaine soumission la relance
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.running:
+                del self._jobs[key]
+
+    def running(self):
+        with self._lock:
+            return [job for job in self._jobs.values() if job.running]
+
+    def _prune(self):
+        finished = [key for key, job in self._jobs.items() if not job.running]
+        for key in finished[:max(0, len(finished) - self.kept)]:
+            del self._jobs[key]
+
+    @staticmethod
+    def _run(job, fn, args):
+        try:
+            job.result = fn(job, *args)
+        except Exception as e:
+            job.error = e
+        finally:
+            job.finished = time.time()
+
+
+JOBS = JobQueue()
+
+# Analyses (stock, commandes) déjà enregistrées par ce processus, par type d'enregistrement
+_recorded = set()
+_recorded_lock = threading.Lock()
+
+
+def claim_record(stock_key, orders_key, *scope):
+    # True pour le 1er appel seulement : celui-là enregistre l'analyse.
+    # scope distingue les enregistrements, ex. ("historique", utilisateur) ou ("tendances",)
+    key = (stock_key, orders_key, *scope)
+    with _recorded_lock:
+        if key in _recorded:
+            return False
+        _recorded.add(key)
+        return True
+
+
+def detach(file):
+    # Copie en mémoire d'un fichier uploadé : le script continue de relire l'original
+    # (hash à chaque rerun) pendant que la tâche lit sa copie
+    copy = io.BytesIO(file.getvalue() if hasattr(file, "getvalue") else file.read())
+    copy.name = getattr(file, "name", "")
+    return copy
+
+
+# --- Tâches ---
+
+ANALYSIS_STAGES = ("extraction", "allocation", "agrégats")
+EXPORT_STAGES = ("export",)
+LIVE_STAGES = ("stock_bc",)
+
+
+def analysis_key(stock_key, orders_keys, priority, strategy):
+    return ("analyse", stock_key, *orders_keys, priority, strategy)
+
+
+def analysis_job(job, stock_key, df_stock, pdf_files, orders_keys, priority, strategy, user=None):
+    # PDF -> commandes -> allocation -> agrégats ; les étapes déjà en cache ne sont pas recalculées
+    job.report("extraction")
+    with metrics.measure("extraction", user) as m:
+        orders_key, (df_cde, doublons) = pipeline.orders_stage(
+            pdf_files, progress=lambda done, total: job.report("extraction", done, total), keys=orders_keys
+        )
+        m["rows"] = len(df_cde)
+    if df_cde.empty:
+        return {"orders_key": orders_key, "allocation_key": None}
+
+    job.report("allocation")
+    with metrics.measure("allocation", user, rows=len(df_cde)):
+        allocation_key, lignes = pipeline.allocation_stage(stock_key, df_stock, orders_key, df_cde, priority, strategy)
+        job.report("agrégats")
+        pipeline.aggregate_stage(allocation_key, lignes)
+    return {"orders_key": orders_key, "allocation_key": allocation_key}
+
+
+def analysis_results(stock_key, df_stock, pdf_files, orders_keys, priority, strategy):
+    # Frames d'une analyse terminée, relues dans pipeline.STAGES ; recalculées ici,
+    # sans tâche, seulement si le cache les a évincées depuis
+    orders_key, (df_cde, doublons) = pipeline.orders_stage(pdf_files, keys=orders_keys)
+    result = {"orders_key": orders_key, "df_cde": df_cde, "doublons": doublons}
+    if df_cde.empty:
+        return result
+    allocation_key, lignes = pipeline.allocation_stage(stock_key, df_stock, orders_key, df_cde, priority, strategy)
+    return {**result, "allocation_key": allocation_key, "lignes": lignes, "df_ana": pipeline.aggregate_stage(allocation_key, lignes)}
+
+
+def export_job(job, allocation_key, df_ana, lignes, user=None):
+    # Classeur mis dans pipeline.STAGES ; le bouton de téléchargement l'y relit
+    job.report("export")
+    with metrics.measure("export", user, rows=len(lignes)):
+        pipeline.export_stage(allocation_key, df_ana, lignes)
+
+
+def live_sync_job(job, item_codes, user=None):
+    # Relevé BC des articles périmés (session navigateur partagée) ; résultat dans live.LIVE_STOCK
+    job.report("stock_bc")
+    if "BC_USERNAME" not in os.environ or "BC_PASSWORD" not in os.environ:
+        raise ValueError("Identifiants BC absents (variables BC_USERNAME / BC_PASSWORD)")
+    with metrics.measure("stock_bc", user, rows=len(item_codes)):
+        session = live.get_session(os.environ["BC_USERNAME"], os.environ["BC_PASSWORD"])
+        live.LIVE_STOCK.sync(item_codes, session.fetch)
@@ -0,0 +1,126 @@
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+
+from stock import derive_columns
+
+# Au-delà de cette durée (s), un inventaire relevé dans BC est relu à la prochaine synchronisation
+LIVE_TTL_S = int(os.environ.get("GESTHOR_LIVE_TTL", "900"))
+
+_SPACES = re.compile(r"\s")  # couvre aussi les espaces insécables des nombres BC
+
+
+def parse_inventory(text):
+    # "1 234,5" (séparateurs BC) -> 1234.5 ; None si la cellule est vide ou illisible
+    if text is None:
+        return None
+    try:
+        return float(_SPACES.sub("", str(text)).replace(",", "."))
+    except ValueError:
+        return None
+
+
+class LiveStock:
+    # Inventaires relevés dans BC, par article, avec l'heure du relevé.
+    # Partagé par toutes les sessions : c'est le même BC pour tout le monde.
+    # version change à chaque relevé : elle entre dans la clé du stock fusionné (pipeline.live_stock_stage).
+
+    def __init__(self, ttl=LIVE_TTL_S):
+        self.ttl = ttl
+        self.version = 0
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def stale(self, item_codes, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            return [
+                code for code in dict.fromkeys(str(c) for c in item_codes)
+                if code not in self._values or now - self._values[code][1] > self.ttl
+            ]
+
+    def update(self, fetched, now=None):
+        # fetched : {article: texte de la cellule Inventory (ou None si introuvable)}
+        # Introuvables et illisibles gardés en (None, heure) : pas relus avant le TTL,
+        # sans quoi chaque synchronisation réattendrait leur délai de recherche dans BC
+        now = time.time() if now is None else now
+        values = {code: parse_inventory(text) for code, text in fetched.items()}
+        with self._lock:
+            for code, value in values.items():
+                self._values[code] = (value, now)
+            if any(value is not None for value in values.values()):
+                self.version += 1
+        return sum(value is not None for value in values.values())
+
+    def sync(self, item_codes, fetch):
+        # Relève seulement les articles jamais lus ou périmés ; renvoie la liste des articles relus
+        stale = self.stale(item_codes)
+        if stale:
+            self.update(fetch(stale))
+        return stale
+
+    def fetched_at(self, item_codes):
+        # Articles dont l'inventaire a été lu dans BC (introuvables exclus) -> heure du relevé
+        with self._lock:
+            return {
+                code: self._values[code][1] for code in map(str, item_codes)
+                if code in self._values and self._values[code][0] is not None
+            }
+
+    def apply(self, df_stock):
+        # Nouveau frame : Inventory remplacé pour les articles relevés, colonnes dérivées recalculées.
+        # Articles relevés absents de l'Excel ajoutés en fin de frame (libellés "Ref X" comme
+        # dans l'allocation). Le frame partagé n'est pas modifié. -> (df, articles dont l'inventaire a changé)
+        with self._lock:
+            values = {code: value for code, (value, _) in self._values.items() if value is not None}
+        live = df_stock["N° article."].map(values)
+        mask = live.notna() & (live != df_stock["Inventory"])
+        absents = sorted(set(values).difference(df_stock["N° article."]))
+        if not mask.any() and not absents:
+            return df_stock, []
+        df = df_stock.copy()
+        # Inventaire entier dans l'Excel, décimal possible dans BC
+        df["Inventory"] = df["Inventory"].astype(float)
+        df.loc[mask, "Inventory"] = live[mask]
+        if absents:
+            ajouts = pd.DataFrame({
+                "N° article.": absents,
+                "Description": ["Ref " + code for code in absents],
+                "Inventory": [values[code] for code in absents],
+                "Qty. per Sales Unit of Measure": 1.0,
+            })
+            df = pd.concat([df.drop(columns=["Stock Colis", "Statut"]), ajouts], ignore_index=True)
+        changed = set(df_stock.loc[mask, "N° article."]).union(absents)
+        return derive_columns(df)[df_stock.columns], sorted(changed)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self.version += 1
+
+
+LIVE_STOCK = LiveStock()
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session(username, password, **kwargs):
+    # Session BC unique par processus, ouverte au premier relevé (import de Playwright différé)
+    global _session
+    with _session_lock:
+        if _session is None:
+            from scraper import StockSession
+            _session = StockSession(username, password, **kwargs)
+        return _session
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+# --- Vérification resource (Unix uniquement) ---
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+# Journal des mesures : une ligne JSON par étape, 5 fichiers de 1 Mo au plus
+METRICS_LOG = Path(os.environ.get("GESTHOR_METRICS_LOG", ".gesthor_cache/metrics.log"))
+MAX_BYTES = 1 << 20
+BACKUP_COUNT = 5
+# Dernières mesures gardées en mémoire pour le panneau admin
+RECENT_MAX = 200
+
+_recent = deque(maxlen=RECENT_MAX)
+_lock = threading.Lock()
+_logger = None
+
+
+def _get_logger():
+    global _logger
+    with _lock:
+        if _logger is None:
+            logger = logging.getLogger("gesthor.metrics")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            try:
+                METRICS_LOG.parent.mkdir(parents=True, exist_ok=True)
+                handler = RotatingFileHandler(METRICS_LOG, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+            except OSError:
+                logger.addHandler(logging.NullHandler())
+            _logger = logger
+    return _logger
+
+
+def _rss_mb():
+    # RSS courant (Linux) ; None ailleurs
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_mb():
+    # Pic RSS du processus depuis son démarrage (ru_maxrss en Ko sous Linux, en octets sous macOS)
+    if not RESOURCE_AVAILABLE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
+
+
+@contextmanager
+def measure(stage, user=None, rows=None):
+    # with measure("stock") as m: ... ; m["rows"] = len(df)
+    # Le pic RSS est celui du processus : "peak_delta_mb" > 0 quand l'étape l'a fait monter
+    m = {"rows": rows}
+    peak_before = _peak_rss_mb()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield m
+    except BaseException:
+        status = "erreur"
+        raise
+    finally:
+        record(_entry(stage, user, status, start, m.get("rows"), peak_before))
+
+
+def record_duration(stage, start, user=None, rows=None):
+    # Durée depuis un instant perf_counter() déjà pris (ex. début du script Streamlit)
+    record(_entry(stage, user, "ok", start, rows, None))
+
+
+def _entry(stage, user, status, start, rows, peak_before):
+    peak_after = _peak_rss_mb()
+    return {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "stage": stage,
+        "user": user,
+        "status": status,
+        "duration_s": round(time.perf_counter() - start, 4),
+        "rows": rows,
+        "rss_mb": _round(_rss_mb()),
+        "peak_rss_mb": _round(peak_after),
+        "peak_delta_mb": _round(None if peak_before is None else peak_after - peak_before),
+    }
+
+
+def record(entry):
+    with _lock:
+        _recent.append(entry)
+    _get_logger().info(json.dumps(entry, ensure_ascii=False))
+
+
+def recent(limit=None, stage=None):
+    # Mesures les plus récentes d'abord
+    with _lock:
+        entries = list(reversed(_recent))
+    if stage is not None:
+        entries = [e for e in entries if e["stage"] == stage]
+    return entries[:limit]
@@ -0,0 +1,31 @@
+import threading
+from contextlib import contextmanager
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+MOCK_DIR = Path(__file__).resolve().parent
+
+
+def expected_stock(item_code):
+    # Même règle que la page mock : articles 10000 à 10999
+    code = int(item_code)
+    return str((code * 37) % 500) if 10000 <= code < 11000 else None
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve(port=0):
+    # Sert la page mock en local (cookies et storage state fonctionnent en http, pas en file://)
+    server = ThreadingHTTPServer(("127.0.0.1", port), partial(_QuietHandler, directory=str(MOCK_DIR)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/index.html"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,185 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from allocation import ALLOCATION_VERSION, STRATEGIES, aggregate, allocate_lines, kpis, stock_lookups, update_lines
+from export import build_csv, build_workbook
+from extraction import combine_orders, extract_orders_cached_many, orders_key
+from live import LIVE_STOCK
+from search import StockIndex
+from stock import read_stock, stock_key
+
+# Mémoire allouée aux résultats d'étapes (tous utilisateurs confondus), en Mo
+CACHE_BUDGET_MB = int(os.environ.get("GESTHOR_CACHE_MB", "1024"))
+
+# --- Étapes mémoïsées ---
+# stock -> commandes -> allocation -> agrégats -> export
+# Chaque étape a une clé dérivée de celles dont elle dépend : un tri ou un re-upload
+# identique ne relance rien, un nouveau PDF ne relance pas la lecture du stock, etc.
+
+
+def _sizeof(value):
+    # Estimation de l'empreinte mémoire d'un résultat d'étape
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True, index=True).sum())
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return value.nbytes + sum(map(sys.getsizeof, value.ravel()))
+        return value.nbytes
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(map(_sizeof, value))
+    if isinstance(value, dict):
+        return sum(map(_sizeof, value.values()))
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class StageCache:
+    # Mémo LRU (étape, clé) -> résultat, partagé par toutes les sessions du processus :
+    # un même stock chargé par dix utilisateurs n'est en mémoire qu'une fois, sans copie par rerun.
+    # Les résultats sont partagés : à traiter en lecture seule (copy-on-write pandas pour les dérivés).
+    # Éviction des moins récents au-delà de max_entries ou de max_bytes ; le dernier calculé reste.
+
+    def __init__(self, max_entries=64, max_bytes=CACHE_BUDGET_MB << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, stage, key, compute):
+        # Un calcul déjà en cours pour (étape, clé) dans un autre thread est attendu, pas relancé
+        while True:
+            with self._lock:
+                if (stage, key) in self._entries:
+                    self._entries.move_to_end((stage, key))
+                    return self._entries[(stage, key)]
+                pending = self._pending.get((stage, key))
+                if pending is None:
+                    pending = self._pending[(stage, key)] = threading.Event()
+                    break
+            # Échec ou éviction entre-temps : on reboucle et on calcule nous-mêmes
+            pending.wait()
+
+        try:
+            value = compute()
+            size = _sizeof(value)
+
+            with self._lock:
+                self._entries[(stage, key)] = value
+                self._sizes[(stage, key)] = size
+                self._entries.move_to_end((stage, key))
+                while len(self._entries) > 1 and (
+                    len(self._entries) > self.max_entries or self.nbytes > self.max_bytes
+                ):
+                    evicted, _ = self._entries.popitem(last=False)
+                    del self._sizes[evicted]
+        finally:
+            with self._lock:
+                del self._pending[(stage, key)]
+            pending.set()
+        return value
+
+    @property
+    def nbytes(self):
+        return sum(self._sizes.values())
+
+    def stats(self):
+        # Par étape : nombre d'entrées et mémoire estimée (octets)
+        with self._lock:
+            stats = {}
+            for (stage, _), size in self._sizes.items():
+                count, total = stats.get(stage, (0, 0))
+                stats[stage] = (count + 1, total + size)
+            return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+
+
+STAGES = StageCache()
+
+
+def stock_stage(file):
+    key = stock_key(file)
+    return key, STAGES.get_or_compute("stock", key, lambda: read_stock(file, key))
+
+
+def lookups_stage(stock_key, df_stock):
+    # Articles -> stock / description, préparés une fois par fichier stock pour toutes les analyses
+    return STAGES.get_or_compute("lookups", stock_key, lambda: stock_lookups(df_stock))
+
+
+def search_index_stage(stock_key, df_stock):
+    return STAGES.get_or_compute("search_index", stock_key, lambda: StockIndex(df_stock))
+
+
+def orders_stage(pdf_files, workers=None, progress=None, keys=None):
+    # Plusieurs PDF : parsés ensemble, commandes en double écartées -> (df_cde, doublons)
+    # progress : callback(pages faites, pages au total), appelé seulement si les PDF sont parsés
+    keys = keys or [orders_key(pdf_file) for pdf_file in pdf_files]
+    key = keys[0] if len(keys) == 1 else hashlib.sha256("+".join(keys).encode()).hexdigest()
+    return key, STAGES.get_or_compute(
+        "orders", key, lambda: combine_orders(extract_orders_cached_many(pdf_files, workers, keys, progress))
+    )
+
+
+def allocation_stage(stock_key, df_stock, orders_key, df_cde, priority="commande", strategy="fifo"):
+    key = f"{stock_key}|{orders_key}|{priority}|{strategy}|a{ALLOCATION_VERSION}"
+    return key, STAGES.get_or_compute(
+        "allocation", key,
+        lambda: allocate_lines(df_cde, df_stock, priority, strategy, lookups_stage(stock_key, df_stock))
+    )
+
+
+def live_stock_stage(stock_key, df_stock):
+    # Stock Excel + inventaires relevés dans BC -> (clé, (df, articles modifiés))
+    version = LIVE_STOCK.version
+    if not version:
+        return stock_key, (df_stock, [])
+    key = f"{stock_key}|live{version}"
+    return key, STAGES.get_or_compute("stock_live", key, lambda: LIVE_STOCK.apply(df_stock))
+
+
+def live_allocation_stage(allocation_key, lignes, live_key, df_live, refs, strategy="fifo"):
+    # Allocation existante mise à jour pour les seules réf. dont le stock a changé
+    if not refs:
+        return allocation_key, lignes
+    key = f"{allocation_key}|{live_key}"
+    return key, STAGES.get_or_compute(
+        "allocation", key, lambda: update_lines(lignes, df_live, refs, strategy, lookups_stage(live_key, df_live))
+    )
+
+
+def aggregate_stage(allocation_key, lignes):
+    return STAGES.get_or_compute("aggregates", allocation_key, lambda: aggregate(lignes))
+
+
+def export_stage(allocation_key, df_ana, lignes):
+    return STAGES.get_or_compute("export_xlsx", allocation_key, lambda: build_workbook(df_ana, lignes))
+
+
+def csv_stage(orders_key, df_cde):
+    return STAGES.get_or_compute("export_csv", orders_key, lambda: build_csv(df_cde))
+
+
+def strategies_stage(stock_key, df_stock, orders_key, df_cde, priority="commande"):
+    # KPI de chaque stratégie d'allocation, pour comparaison
+    rows = []
+    for strategy, (label, _) in STRATEGIES.items():
+        allocation_key, lignes = allocation_stage(stock_key, df_stock, orders_key, df_cde, priority, strategy)
+        rows.append({"Stratégie": label, **kpis(aggregate_stage(allocation_key, lignes))})
+    return pd.DataFrame(rows)
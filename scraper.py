@@ -1,35 +1,215 @@
-from playwright.sync_api import sync_playwright
+import os
+import asyncio
+import threading
+from pathlib import Path
+
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+
+BC_URL = "https://bc.suntat.group/Kardesler/?company=BAK%20Kardesler&dc=0"
+# Session authentifiée (cookies + storage) réutilisée d'un lot à l'autre
+STORAGE_STATE = os.environ.get("GESTHOR_BC_STATE", ".gesthor_cache/bc_state.json")
+
+LOGIN_INPUT = "#signInName"
+ARTICLES_LINK = "xpath=//span[text()='Articles']"
+SEARCH_INPUT = "input[aria-label='Rechercher']"
+
+
+async def _ensure_logged_in(page, url, username, password):
+    await page.goto(url)
+
+    # Session sauvegardée valide : le menu s'affiche directement ; sinon formulaire de connexion
+    login = page.locator(LOGIN_INPUT)
+    articles = page.locator(ARTICLES_LINK)
+    await login.or_(articles).first.wait_for(timeout=60000)
+    if not await login.is_visible():
+        return False
+
+    await page.fill(LOGIN_INPUT, username)
+    await page.fill("#password", password)
+    await page.click("#next")
+
+    print("Connexion effectuée, attente du chargement…")
+    await articles.wait_for(timeout=60000)
+    return True
+
+
+async def _open_articles(page, url=None):
+    if url is not None:
+        await page.goto(url)
+    await page.click(ARTICLES_LINK)
+    await page.wait_for_selector(SEARCH_INPUT, timeout=60000)
+
+
+async def _lookup(page, item_code):
+    await page.fill(SEARCH_INPUT, item_code)
+
+    # Prêt quand la première ligne de la grille porte exactement le code recherché
+    row = page.locator(
+        f"xpath=//div[@role='row' and @aria-rowindex='2'][.//text()[normalize-space()='{item_code}']]"
+    )
+    cell = row.locator("xpath=.//div[@col-id='Inventory']")
+    return await cell.inner_text(timeout=30000)
+
+
+async def _worker(page, queue, results):
+    while True:
+        try:
+            item_code = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        try:
+            results[item_code] = await _lookup(page, item_code)
+        except PlaywrightTimeoutError:
+            print(f"Article introuvable : {item_code}")
+            results[item_code] = None
+        except Exception as e:
+            # Onglet inutilisable (fermé, déconnecté…) : l'article retourne dans la file
+            # pour les autres onglets, ce worker s'arrête sans interrompre les autres
+            print(f"Onglet BC en erreur sur {item_code} : {e}")
+            queue.put_nowait(item_code)
+            raise
+
+
+async def _open_pages(p, username, password, workers, url, headless, storage_state):
+    browser = await p.chromium.launch(headless=headless)
+    state = storage_state if storage_state and Path(storage_state).exists() else None
+    context = await browser.new_context(storage_state=state)
+
+    print("Ouverture de la page BC…")
+    page = await context.new_page()
+    if await _ensure_logged_in(page, url, username, password) and storage_state:
+        Path(storage_state).parent.mkdir(parents=True, exist_ok=True)
+        await context.storage_state(path=storage_state)
+
+    # Les autres onglets partagent les cookies du contexte : pas de nouvelle connexion
+    pages = [page] + [await context.new_page() for _ in range(workers - 1)]
+    await asyncio.gather(_open_articles(page), *(_open_articles(pg, url) for pg in pages[1:]))
+    return browser, pages
+
+
+async def _fetch(pages, item_codes):
+    queue = asyncio.Queue()
+    for item_code in item_codes:
+        queue.put_nowait(item_code)
+    results = {}
+    # return_exceptions : tous les workers vont au bout avant qu'une erreur ne remonte,
+    # aucun onglet n'est donc fermé (réouverture de StockSession) sous un worker en cours
+    outcomes = await asyncio.gather(*(_worker(pg, queue, results) for pg in pages), return_exceptions=True)
+    errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    if errors and len(results) < len(item_codes):
+        raise errors[0]
+
+    print(f"Stocks trouvés : {sum(v is not None for v in results.values())}/{len(item_codes)}")
+    return {item_code: results.get(item_code) for item_code in item_codes}
+
+
+def _unique_codes(item_codes):
+    return list(dict.fromkeys(str(c) for c in item_codes))
+
+
+async def get_stocks_async(item_codes, username, password, workers=4, url=BC_URL,
+                           headless=True, storage_state=STORAGE_STATE):
+    item_codes = _unique_codes(item_codes)
+    if not item_codes:
+        return {}
+    workers = max(1, min(workers, len(item_codes)))
+
+    async with async_playwright() as p:
+        browser, pages = await _open_pages(p, username, password, workers, url, headless, storage_state)
+        results = await _fetch(pages, item_codes)
+        await browser.close()
+    return results
+
+
+def get_stocks(item_codes, username, password, workers=4, url=BC_URL,
+               headless=True, storage_state=STORAGE_STATE):
+    return asyncio.run(get_stocks_async(
+        item_codes, username, password, workers=workers, url=url,
+        headless=headless, storage_state=storage_state,
+    ))
+
 
 def get_stock(item_code, username, password):
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context()
-        page = context.new_page()
-
-        print("Ouverture de la page BC…")
-        page.goto("https://bc.suntat.group/Kardesler/?company=BAK%20Kardesler&dc=0")
-
-        # LOGIN
-        page.wait_for_selector("#signInName", timeout=60000)
-        page.fill("#signInName", username)
-        page.fill("#password", password)
-        page.click("#next")
-
-        print("Connexion effectuée, attente du chargement…")
-        page.wait_for_timeout(8000)
-
-        # Aller à Articles
-        page.click("xpath=//span[text()='Articles']")
-        page.wait_for_selector("input[aria-label='Rechercher']", timeout=60000)
-
-        # Rechercher l'article
-        page.fill("input[aria-label='Rechercher']", item_code)
-        page.wait_for_timeout(3000)
-
-        # Récupérer le stock
-        cell = page.locator("//div[@role='row' and @aria-rowindex='2']//div[@col-id='Inventory']")
-        stock = cell.inner_text(timeout=30000)
-
-        browser.close()
-        print(f"Stock trouvé : {stock}")
-        return stock
+    return get_stocks([item_code], username, password, workers=1)[str(item_code)]
+
+
+class StockSession:
+    # Navigateur BC gardé ouvert entre deux relevés : la connexion et l'ouverture des onglets
+    # "Articles" ne sont payées qu'une fois. La boucle asyncio tourne dans un thread dédié,
+    # fetch() est donc appelable depuis du code synchrone (script Streamlit).
+
+    def __init__(self, username, password, workers=4, url=BC_URL, headless=True, storage_state=STORAGE_STATE):
+        self._args = (username, password, workers, url, headless, storage_state)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="bc-session", daemon=True)
+        self._thread.start()
+        self._lock = threading.Lock()
+        self._playwright = None
+        self._browser = None
+        self._pages = None
+
+    def _run(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    async def _open(self):
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        self._browser, self._pages = await _open_pages(self._playwright, *self._args)
+
+    async def _close_browser(self):
+        if self._browser is not None:
+            browser, self._browser, self._pages = self._browser, None, None
+            await browser.close()
+
+    async def _fetch(self, item_codes):
+        if self._pages is None:
+            await self._open()
+        try:
+            return await _fetch(self._pages, item_codes)
+        except PlaywrightTimeoutError:
+            raise
+        except Exception:
+            # Onglet fermé, session expirée… : une nouvelle ouverture, puis un seul nouvel essai
+            await self._close_browser()
+            await self._open()
+            return await _fetch(self._pages, item_codes)
+
+    def fetch(self, item_codes, timeout=None):
+        item_codes = _unique_codes(item_codes)
+        if not item_codes:
+            return {}
+        with self._lock:
+            return self._run(self._fetch(item_codes), timeout)
+
+    def close(self):
+        async def shutdown():
+            await self._close_browser()
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+        with self._lock:
+            self._run(shutdown())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    # Test hors BC : python scraper.py --mock 10001 10002 10003
+    import sys
+    import tempfile
+
+    from mock_bc import serve
+
+    args = sys.argv[1:]
+    if args[:1] == ["--mock"]:
+        with serve() as mock_url, tempfile.TemporaryDirectory() as tmp:
+            state = os.path.join(tmp, "state.json")
+            for _ in range(2):  # 2e passage : session reprise depuis le storage state
+                print(get_stocks(args[1:], "demo", "demo", url=mock_url, storage_state=state))
+            # Session persistante : navigateur ouvert une fois pour deux relevés
+            session = StockSession("demo", "demo", url=mock_url, storage_state=state)
+            for _ in range(2):
+                print(session.fetch(args[1:]))
+            session.close()
+    else:
+        print(get_stocks(args, os.environ["BC_USERNAME"], os.environ["BC_PASSWORD"]))
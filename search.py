@@ -0,0 +1,80 @@
+import sys
+from collections import defaultdict
+
+import numpy as np
+
+NGRAM = 3
+
+
+def _ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class StockIndex:
+    # Index de recherche construit une fois par fichier stock :
+    # trigrammes code + description -> positions de lignes, pour la recherche par sous-chaîne.
+    # Les résultats sont des positions (iloc) dans le DataFrame indexé, classés par pertinence :
+    # code exact, préfixe du code, code contenant, mot de la description, description contenant.
+
+    def __init__(self, df):
+        self.codes = [str(c).lower() for c in df["N° article."]]
+        self.descriptions = [str(d).lower() for d in df["Description"]]
+
+        postings = defaultdict(list)
+        for i, (code, desc) in enumerate(zip(self.codes, self.descriptions)):
+            for gram in _ngrams(code) | _ngrams(desc):
+                postings[gram].append(i)
+        self._postings = {gram: np.array(rows, dtype=np.int32) for gram, rows in postings.items()}
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        # Empreinte approximative (budget mémoire du cache d'étapes)
+        texts = sum(map(sys.getsizeof, self.codes)) + sum(map(sys.getsizeof, self.descriptions))
+        return texts + sum(p.nbytes + 64 for p in self._postings.values())
+
+    def _candidates(self, query):
+        grams = _ngrams(query)
+        if not grams:
+            # Requête trop courte pour les trigrammes : balayage des textes déjà en minuscules
+            return range(len(self.codes))
+        lists = sorted((self._postings.get(g) for g in grams), key=lambda a: 0 if a is None else len(a))
+        if lists[0] is None:
+            return []
+        rows = lists[0]
+        for other in lists[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+            if not len(rows):
+                break
+        return rows.tolist()
+
+    def _rank(self, query, i):
+        code, desc = self.codes[i], self.descriptions[i]
+        if code == query:
+            return 0
+        if code.startswith(query):
+            return 1
+        if query in code:
+            return 2
+        if desc.startswith(query) or f" {query}" in desc:
+            return 3
+        return 4
+
+    def search(self, query, limit=None):
+        query = query.strip().lower()
+        if not query:
+            return list(range(len(self.codes)))
+
+        candidates = self._candidates(query)
+        if len(query) == NGRAM:
+            # Un seul trigramme : la liste de postings est déjà exacte
+            hits = list(candidates)
+        else:
+            hits = [
+                i for i in candidates
+                if query in self.codes[i] or query in self.descriptions[i]
+            ]
+        hits.sort(key=lambda i: (self._rank(query, i), i))
+        return hits[:limit] if limit else hits
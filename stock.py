@@ -0,0 +1,233 @@
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from cache import FrameCache, file_hash
+
+# Colonnes utilisées par l'application : seules elles sont conservées dans le snapshot
+STOCK_COLUMNS = [
+    "N° article.", "Description", "Inventory",
+    "Qty. per Sales Unit of Measure", "Stock Colis", "Statut",
+]
+STATUTS = ["Rupture", "Faible", "OK"]
+# Colonnes lues dans l'export ERP ; les deux dernières sont obligatoires
+SOURCE_COLUMNS = ["N° article.", "Description", "Inventory", "Qty. per Sales Unit of Measure"]
+REQUIRED_COLUMNS = ["Inventory", "Qty. per Sales Unit of Measure"]
+# Lignes de titre tolérées au-dessus de l'en-tête
+HEADER_SCAN_ROWS = 20
+# À incrémenter dès que la normalisation change : invalide les snapshots existants
+STOCK_VERSION = 3
+
+# Disque seul : en mémoire, le stock n'est gardé que par pipeline.STAGES (budget GESTHOR_CACHE_MB)
+# Snapshots Feather non compressés : peu de fichiers, mais gros
+STOCK_CACHE = FrameCache("stock", max_entries=0, fmt="feather", max_files=16, max_disk_mb=1024)
+
+
+def normalize_stock(df):
+    col_map = {c: c.strip() for c in df.columns}
+    df = df.rename(columns=col_map)
+
+    if "N° article." in df.columns:
+        df["N° article."] = df["N° article."].astype(str).str.strip()
+    if "Description" in df.columns:
+        df["Description"] = df["Description"].astype(str).str.strip()
+
+    df["Inventory"] = pd.to_numeric(df["Inventory"], errors='coerce').fillna(0)
+    df["Qty. per Sales Unit of Measure"] = pd.to_numeric(
+        df["Qty. per Sales Unit of Measure"], errors='coerce'
+    ).fillna(1)
+
+    df = derive_columns(df)
+
+    return df[[c for c in STOCK_COLUMNS if c in df.columns]]
+
+
+def derive_columns(df):
+    # Colonnes calculées à partir de l'inventaire (aussi après une mise à jour du stock en direct)
+    df["Stock Colis"] = df["Inventory"] / df["Qty. per Sales Unit of Measure"].replace(0, 1)
+
+    conditions = [(df["Inventory"] <= 0), (df["Inventory"] < 500)]
+    choices = ["Rupture", "Faible"]
+    df["Statut"] = pd.Categorical(np.select(conditions, choices, default="OK"), categories=STATUTS)
+    return df
+
+
+# --- Lecture en flux du classeur ---
+# Un export ERP compte souvent des dizaines de colonnes dont 4 servent : la feuille XML
+# est parcourue en flux (ligne par ligne, mémoire libérée au fur et à mesure) et seules
+# les cellules des colonnes utiles sont converties, sans passer par openpyxl ni read_excel.
+
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+
+def _ns(tag):
+    # "{espace}row" -> "{espace}" (SpreadsheetML "transitional" ou "strict")
+    return tag[:tag.index("}") + 1] if tag.startswith("{") else ""
+
+
+def _rels(archive, path):
+    # Relations d'une partie du paquet : Id -> (type, chemin dans l'archive)
+    rels_path = posixpath.join(posixpath.dirname(path), "_rels", posixpath.basename(path) + ".rels")
+    if rels_path not in archive.namelist():
+        return {}
+    rels = {}
+    for rel in ET.fromstring(archive.read(rels_path)):
+        target = rel.get("Target", "")
+        target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(
+            posixpath.join(posixpath.dirname(path), target)
+        )
+        rels[rel.get("Id")] = (rel.get("Type", ""), target)
+    return rels
+
+
+def _workbook_parts(archive):
+    # -> (1re feuille, table des chaînes partagées ou None), comme pd.read_excel (sheet_name=0)
+    workbook = next(
+        (target for kind, target in _rels(archive, "").values() if kind.endswith("/officeDocument")),
+        "xl/workbook.xml",
+    )
+    rels = _rels(archive, workbook)
+    root = ET.fromstring(archive.read(workbook))
+    sheet = root.find(f"{_ns(root.tag)}sheets/{_ns(root.tag)}sheet")
+    if sheet is None:
+        raise ValueError("Classeur sans feuille")
+    rel_id = next(value for name, value in sheet.attrib.items() if name.endswith("}id"))
+    shared = next((target for kind, target in rels.values() if kind.endswith("/sharedStrings")), None)
+    return rels[rel_id][1], shared
+
+
+def _shared_strings(archive, path):
+    if path is None or path not in archive.namelist():
+        return []
+    strings = []
+    with archive.open(path) as f:
+        for _, el in ET.iterparse(f):
+            ns = _ns(el.tag)
+            if el.tag == f"{ns}si":
+                # Texte simple (<t>) ou riche (<r><t>) ; les annotations phonétiques (<rPh>) sont ignorées
+                strings.append("".join(t.text or "" for t in el.iterfind(f"{ns}t")) +
+                               "".join(t.text or "" for t in el.iterfind(f"{ns}r/{ns}t")))
+                el.clear()
+    return strings
+
+
+@lru_cache(maxsize=None)
+def _column_index(letters):
+    # "A" -> 0, "AB" -> 27
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - 64
+    return index - 1
+
+
+def _number(text):
+    # Comme read_excel : entier si la valeur est entière, flottant sinon
+    try:
+        return int(text)
+    except ValueError:
+        value = float(text)
+        return int(value) if value.is_integer() else value
+
+
+def _cell_value(cell, ns, shared):
+    kind = cell.get("t")
+    if kind == "inlineStr":
+        return "".join(t.text or "" for t in cell.iter(f"{ns}t"))
+    text = cell.findtext(f"{ns}v")
+    if text is None or text == "":
+        return None
+    if kind == "s":
+        return shared[int(text)]
+    if kind == "b":
+        return text == "1"
+    if kind in ("str", "e", "d"):
+        return text
+    try:
+        return _number(text)
+    except ValueError:
+        return text
+
+
+def _row_values(row, ns, shared, wanted=None, last=None):
+    # {n° de colonne: valeur} ; wanted / last : seules ces colonnes sont converties
+    values = {}
+    position = 0
+    for cell in row:
+        ref = cell.get("r")
+        index = _column_index(ref.rstrip("0123456789")) if ref else position
+        position = index + 1
+        if last is not None and index > last:
+            break
+        if wanted is None or index in wanted:
+            values[index] = _cell_value(cell, ns, shared)
+    return values
+
+
+def _find_header(values):
+    # En-tête : la ligne qui porte les colonnes obligatoires ; 1re occurrence de chaque nom
+    names = {}
+    for index in sorted(values):
+        if values[index] is not None:
+            names.setdefault(str(values[index]).strip(), index)
+    if not all(name in names for name in REQUIRED_COLUMNS):
+        return None
+    return {name: names[name] for name in SOURCE_COLUMNS if name in names}
+
+
+def read_stock_columns(file):
+    # Classeur .xlsx -> DataFrame des seules SOURCE_COLUMNS présentes, valeurs typées à la lecture
+    # (nombres en int / float, textes en str, cellules vides en None). Lignes vides ignorées.
+    if hasattr(file, "seek"):
+        file.seek(0)
+    with zipfile.ZipFile(file) as archive:
+        sheet_path, shared_path = _workbook_parts(archive)
+        shared = _shared_strings(archive, shared_path)
+
+        header, data = None, None
+        with archive.open(sheet_path) as sheet:
+            row_tag, scanned = None, 0
+            for _, el in ET.iterparse(sheet):
+                if row_tag is None and (el.tag == "row" or el.tag.endswith("}row")):
+                    row_tag = f"{_ns(el.tag)}row"
+                if el.tag != row_tag:
+                    continue
+
+                if header is None:
+                    header = _find_header(_row_values(el, _ns(row_tag), shared))
+                    scanned += 1
+                    if header is None and scanned >= HEADER_SCAN_ROWS:
+                        break
+                    if header is not None:
+                        ns, wanted, last = _ns(row_tag), set(header.values()), max(header.values())
+                        data = {name: [] for name in header}
+                else:
+                    values = _row_values(el, ns, shared, wanted, last)
+                    if any(value is not None for value in values.values()):
+                        for name, index in header.items():
+                            data[name].append(values.get(index))
+                el.clear()
+
+    if header is None:
+        raise ValueError(
+            f"En-tête introuvable dans les {HEADER_SCAN_ROWS} premières lignes "
+            f"(colonnes attendues : {', '.join(REQUIRED_COLUMNS)})"
+        )
+    return pd.DataFrame(data)
+
+
+def stock_key(file):
+    return f"v{STOCK_VERSION}-{file_hash(file)}"
+
+
+def read_stock(file, key=None):
+    # Excel lu et normalisé une seule fois par contenu, puis relu depuis le snapshot Feather
+    key = key or stock_key(file)
+    df = STOCK_CACHE.get(key)
+    if df is None:
+        df = normalize_stock(read_stock_columns(file))
+        STOCK_CACHE.put(key, df)
+    return df